@@ -1,5 +1,6 @@
 # app/api/admin.py
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from ..core.metrics import METRICS
 
 router = APIRouter()
@@ -9,5 +10,10 @@ def healthz():
     return {"status":"ok"}
 
 @router.get("/metrics", tags=["admin"])
-def metrics():
-    return METRICS.get_snapshot()
+def metrics(format: str = "prometheus"):
+    """
+    Prometheus text exposition by default; ?format=json for the summarized snapshot.
+    """
+    if format == "json":
+        return METRICS.get_snapshot()
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
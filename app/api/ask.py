@@ -1,74 +1,88 @@
 # app/api/ask.py
 from fastapi import APIRouter, BackgroundTasks, HTTPException
-from ..schemas import AskRequest
-from ..db import SessionLocal
-from ..models.chunks import Chunk
-from ..services.vectorstore import get_vectorstore
+from fastapi.responses import StreamingResponse
+from ..schemas import AskRequest, AskBatchRequest
+from ..services.retrieval import aretrieve_chunks, aretrieve_batch
 from ..services.llm_client import call_openai_completion
+from ..services.prompt_builder import build_context, count_tokens
 from ..core.metrics import METRICS
+from ..core import config
+from ..core.executors import LLM_POOL
 from typing import List
 from ..core.logger import logger
+import asyncio
 import json
 
 router = APIRouter()
 
-@router.post("/ask", tags=["ask"])
-def ask(req: AskRequest, background_tasks: BackgroundTasks = None):
+def _build_prompt(question: str, hits: List[dict]):
     """
-    RAG pipeline: retrieve top-k page chunks and then call LLM (if available).
-    Returns answer and citations with doc+page+char spans.
+    Pack de-duplicated context into the token budget, most relevant first.
+    Returns (prompt or None when there is no context, hits used, usage). Tokenizes, so it runs
+    on an executor.
     """
-    METRICS.inc("ask_count", 1)
-    vs = get_vectorstore()
-    db = SessionLocal()
-    # find candidate hits
-    hits_meta = vs.query(req.question, top_k=req.top_k, filter_docs=req.document_ids)
-    hits = []
-    for h in hits_meta:
-        # fetch chunk text from DB by meta
-        chunk = db.query(Chunk).filter(
-            Chunk.document_id == h["document_id"],
-            Chunk.page_no == h["page_no"]
-        ).first()
-        if chunk:
-            hits.append({
-                "document_id": chunk.document_id,
-                "page_no": chunk.page_no,
-                "char_start": chunk.char_start,
-                "char_end": chunk.char_end,
-                "text": (chunk.text[:3000] if chunk.text else "")
-            })
-    citations = [{"document_id": h["document_id"], "page_no": h["page_no"], "char_start": h["char_start"], "char_end": h["char_end"]} for h in hits]
-    # build prompt
-    contexts = "\n\n---\n\n".join([f"Doc: {h['document_id']} Page: {h['page_no']}\n{h['text']}" for h in hits])
+    contexts, hits, context_tokens = build_context(hits)
     if contexts.strip() == "":
-        return {"answer": "No content found in documents", "citations": []}
-    prompt = f"Answer the question using ONLY the provided context.\nQuestion: {req.question}\n\nContext:\n{contexts}\n\nAnswer concisely and include which document/page supports your answer."
+        return None, [], {"prompt_tokens": 0, "context_tokens": 0, "chunks": 0}
+    prompt = f"Answer the question using ONLY the provided context.\nQuestion: {question}\n\nContext:\n{contexts}\n\nAnswer concisely and include which document/page supports your answer."
+    usage = {"prompt_tokens": count_tokens(prompt), "context_tokens": context_tokens, "chunks": len(hits)}
+    logger.info("ask prompt: %d tokens (%d context, %d chunks)", usage["prompt_tokens"], context_tokens, len(hits))
+    return prompt, hits, usage
+
+def _extractive_answer(question: str, hits: List[dict]) -> str:
+    # fallback extractive: choose sentences overlapping with question tokens
+    import re
+    q_tokens = set(re.findall(r"\w+", question.lower()))
+    sentences = []
+    for h in hits:
+        sents = re.split(r'(?<=[\.\n])\s+', h["text"])
+        for s in sents:
+            score = len(q_tokens & set(re.findall(r"\w+", s.lower())))
+            if score > 0:
+                sentences.append((score, s))
+    sentences.sort(reverse=True)
+    top = [s for sc, s in sentences[:5]]
+    return " ".join(top) if top else (hits[0]["text"][:500] + "...")
+
+async def _answer(question: str, hits: List[dict]) -> dict:
+    """
+    Pack hits into a prompt and answer with the LLM (or the extractive fallback).
+    Returns {"answer", "citations", "usage"}. Prompt assembly and the fallback run on the LLM
+    pool with the call itself, keeping tokenization and regex work off the event loop.
+    """
+    prompt, hits, usage = await LLM_POOL.run(_build_prompt, question, hits)
+    citations = [{"document_id": h["document_id"], "page_no": h["page_no"], "char_start": h["char_start"], "char_end": h["char_end"]} for h in hits]
+    if prompt is None:
+        return {"answer": "No content found in documents", "citations": [], "usage": usage}
     # call LLM if configured
     try:
         from ..core.config import OPENAI_KEY
         if OPENAI_KEY:
-            answer = call_openai_completion(prompt, max_tokens=400, temperature=0.0)
+            answer = await LLM_POOL.run(call_openai_completion, prompt, max_tokens=400, temperature=0.0)
         else:
-            # fallback extractive: choose sentences overlapping with question tokens
-            import re, heapq
-            q_tokens = set(re.findall(r"\w+", req.question.lower()))
-            sentences = []
-            for h in hits:
-                sents = re.split(r'(?<=[\.\n])\s+', h["text"])
-                for s in sents:
-                    score = len(q_tokens & set(re.findall(r"\w+", s.lower())))
-                    if score > 0:
-                        sentences.append((score, s))
-            sentences.sort(reverse=True)
-            top = [s for sc, s in sentences[:5]]
-            answer = " ".join(top) if top else (hits[0]["text"][:500] + "...")
+            answer = await LLM_POOL.run(_extractive_answer, question, hits)
+    except HTTPException:
+        # executor backpressure (503) goes back to the client as-is
+        raise
     except Exception as e:
         logger.exception("Error during LLM/fallback: %s", e)
         answer = "Error generating answer: " + str(e)
+    return {"answer": answer, "citations": citations, "usage": usage}
+
+@router.post("/ask", tags=["ask"])
+async def ask(req: AskRequest, background_tasks: BackgroundTasks = None):
+    """
+    RAG pipeline: retrieve candidate chunks, re-rank to top-k and then call LLM (if available).
+    Returns answer and citations with doc+page+char spans.
+    """
+    METRICS.inc("ask_count", 1)
+    # wide candidate retrieval + re-rank down to top_k
+    hits = await aretrieve_chunks(req.question, document_ids=req.document_ids, top_k=req.top_k)
+    result = await _answer(req.question, hits)
+    answer, citations = result["answer"], result["citations"]
     # optional webhook
     if req.webhook_url:
-        import aiohttp, asyncio
+        import aiohttp
         async def _emit():
             try:
                 async with aiohttp.ClientSession() as s:
@@ -77,4 +91,47 @@ def ask(req: AskRequest, background_tasks: BackgroundTasks = None):
                 logger.exception("webhook emit failed: %s", ex)
         if background_tasks:
             background_tasks.add_task(_emit)
-    return {"answer": answer, "citations": citations}
+    return result
+
+@router.post("/ask/batch", tags=["ask"])
+async def ask_batch(req: AskBatchRequest):
+    """
+    Ask many questions of many documents in one call (e.g. a standard review checklist).
+    Retrieval is batched: one embedding call, one index search, one chunk query, one re-rank pass.
+    Answers are generated concurrently and streamed as NDJSON lines as they complete:
+      {"question_index", "question", "document_id", "answer", "citations", "usage"}
+    followed by {"done": true, "results": n}.
+    """
+    n_docs = len(req.document_ids) if req.document_ids else 1
+    if not req.questions:
+        raise HTTPException(400, detail="questions required")
+    if len(req.questions) * n_docs > config.ASK_BATCH_MAX_PAIRS:
+        raise HTTPException(400, detail=f"at most {config.ASK_BATCH_MAX_PAIRS} question x document pairs per batch")
+    METRICS.inc("ask_count", len(req.questions) * n_docs)
+    # all DB work happens before streaming starts, in a short session of its own
+    groups = await aretrieve_batch(req.questions, document_ids=req.document_ids, top_k=req.top_k)
+    if req.document_ids:
+        for qi in range(len(req.questions)):
+            for doc_id in req.document_ids:
+                groups.setdefault((qi, doc_id), [])
+    slots = asyncio.Semaphore(config.ASK_BATCH_LLM_CONCURRENCY)
+
+    async def _one(qi: int, doc_id, hits):
+        async with slots:
+            try:
+                result = await _answer(req.questions[qi], hits)
+            except HTTPException as e:
+                result = {"answer": None, "citations": [], "error": e.detail}
+        return {"question_index": qi, "question": req.questions[qi], "document_id": doc_id, **result}
+
+    async def _stream():
+        tasks = [asyncio.ensure_future(_one(qi, doc_id, hits)) for (qi, doc_id), hits in groups.items()]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield json.dumps(await fut) + "\n"
+            yield json.dumps({"done": True, "results": len(tasks)}) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
@@ -1,7 +1,8 @@
 # app/api/audit.py
-from fastapi import APIRouter, HTTPException
-from ..services.risk_rules import audit_text_for_risks
-from ..db import SessionLocal
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from ..services.risk_rules import audit_text_for_risks, flush_rule_stats, get_rule_registry
+from ..db import get_db
 from ..models.document import Document
 from ..models.chunks import Chunk
 from ..core.metrics import METRICS
@@ -9,25 +10,35 @@ from ..core.metrics import METRICS
 router = APIRouter()
 
 @router.post("/audit", tags=["audit"])
-def audit(payload: dict = None):
+def audit(payload: dict = None, db: Session = Depends(get_db)):
     """
     payload may include {"document_ids": ["id1","id2"]} or absent to check all.
     """
     METRICS.inc("audit_count", 1)
-    db = SessionLocal()
     doc_ids = None
     if payload:
         doc_ids = payload.get("document_ids")
     findings = []
+    rule_stats = {}  # per-rule scan metrics, recorded once for the whole request
     if doc_ids:
         docs = db.query(Document).filter(Document.id.in_(doc_ids)).all()
     else:
         docs = db.query(Document).all()
     for d in docs:
         # use chunk text per page
-        chunks = db.query(Chunk).filter(Chunk.document_id == d.id).all()
-        for c in chunks:
-            f = audit_text_for_risks(c.text or "", d.id, c.page_no)
-            for ff in f:
-                findings.append(ff)
+        with METRICS.timer("db_fetch"):
+            chunks = db.query(Chunk).filter(Chunk.document_id == d.id).all()
+        with METRICS.timer("audit"):
+            for c in chunks:
+                f = audit_text_for_risks(c.text or "", d.id, c.page_no, rule_stats)
+                for ff in f:
+                    findings.append(ff)
+    flush_rule_stats(rule_stats)
     return findings
+
+@router.get("/audit/rules", tags=["audit"])
+def audit_rules():
+    """
+    Loaded risk rule packs with their versions and rule ids.
+    """
+    return get_rule_registry().packs()
@@ -1,6 +1,7 @@
 # app/api/extract.py
-from fastapi import APIRouter, HTTPException
-from ..db import SessionLocal
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from ..db import get_db
 from ..models.document import Document
 from ..services.extractors import llm_extract_fields, heuristic_extract_fields
 from ..core.metrics import METRICS
@@ -8,7 +9,7 @@ from ..core.metrics import METRICS
 router = APIRouter()
 
 @router.post("/extract", tags=["extract"])
-def extract(payload: dict):
+def extract(payload: dict, db: Session = Depends(get_db)):
     """
     Given {"document_id":"..."} returns structured fields.
     """
@@ -16,7 +17,6 @@ def extract(payload: dict):
     doc_id = payload.get("document_id")
     if not doc_id:
         raise HTTPException(400, detail="document_id required")
-    db = SessionLocal()
     doc = db.query(Document).filter(Document.id == doc_id).first()
     if not doc:
         raise HTTPException(404, detail="document not found")
@@ -1,90 +1,175 @@
 # app/api/ingest.py
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
 from typing import List
+from ..core import config
 from ..core.logger import logger
 from ..core.metrics import METRICS
-from ..services.pdf_loader import extract_pages_text
-from ..services.text_chunker import chunk_page_texts
+from ..core.executors import DB_POOL, MODEL_POOL, PARSE_POOL
+from ..services.ingest_worker import parse_and_store
 from ..services.vectorstore import get_vectorstore
-from ..db import SessionLocal
-from ..models.document import Document
-from ..models.chunks import Chunk
+from ..services.embed_pipeline import get_embed_pipeline, index_document
+import asyncio
+import hashlib
 import uuid
 import os
 
 router = APIRouter()
 
-@router.post("/ingest", tags=["ingest"])
-async def ingest(files: List[UploadFile] = File(...), background_tasks: BackgroundTasks = None, webhook_url: str = None):
+# bounds how many uploads are being parsed/stored at once across all requests
+_file_slots = asyncio.Semaphore(config.INGEST_MAX_CONCURRENT_FILES)
+
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+            "required": ["files"],
+        }}},
+    }
+}
+
+def _remove(paths: List[str]):
+    for p in paths:
+        if os.path.exists(p):
+            os.remove(p)
+
+async def _receive_uploads(request: Request) -> List[dict]:
+    """
+    Parse the multipart body straight off the socket, writing each "files" part to data/uploads
+    in UPLOAD_CHUNK_SIZE blocks (on the DB/file I/O pool) and hashing as it goes. Nothing is
+    spooled to a temp file first, and the request fails with 413 as soon as more than
+    MAX_UPLOAD_BYTES have arrived; files written so far are removed.
+    """
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if ctype != b"multipart/form-data" or not boundary:
+        raise HTTPException(415, detail="expected multipart/form-data with one or more 'files' parts")
+
+    saved: List[dict] = []
+    part = {}  # state of the part being parsed
+    events: List[tuple] = []
+
+    def _on_header_field(data, start, end):
+        part["field"] = part.get("field", b"") + data[start:end]
+
+    def _on_header_value(data, start, end):
+        part["value"] = part.get("value", b"") + data[start:end]
+
+    def _on_header_end():
+        part.setdefault("headers", {})[part.pop("field", b"").lower()] = part.pop("value", b"")
+
+    callbacks = {
+        "on_part_begin": lambda: part.clear(),
+        "on_header_field": _on_header_field,
+        "on_header_value": _on_header_value,
+        "on_header_end": _on_header_end,
+        "on_headers_finished": lambda: events.append(("headers", part.get("headers", {}))),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    }
+    parser = MultipartParser(boundary, callbacks)
+    received = 0
+    cur = None  # {"fh", "sha", "size", "buf", "buf_len", ...} for the file part being written
+    try:
+        async for block in request.stream():
+            received += len(block)
+            if received > config.MAX_UPLOAD_BYTES:
+                raise HTTPException(413, detail=f"upload exceeds {config.MAX_UPLOAD_BYTES} bytes")
+            try:
+                parser.write(block)
+            except MultipartParseError as e:
+                raise HTTPException(400, detail=f"malformed multipart body: {e}")
+            for kind, value in events:
+                if kind == "headers":
+                    _, disp = parse_options_header(value.get(b"content-disposition", b""))
+                    name = disp.get(b"name", b"").decode("utf-8", "replace")
+                    raw_name = disp.get(b"filename")
+                    if name != "files" or raw_name is None:
+                        continue  # other form fields are ignored
+                    file_id = str(uuid.uuid4())
+                    filename = os.path.basename(raw_name.decode("utf-8", "replace")) or f"{file_id}.pdf"
+                    pdf_path = os.path.join(config.UPLOAD_DIR, f"{file_id}_{filename}")
+                    cur = {"document_id": file_id, "filename": filename, "pdf_path": pdf_path,
+                           "sha": hashlib.sha256(), "size": 0, "buf": [], "buf_len": 0}
+                    saved.append(cur)
+                    cur["fh"] = await DB_POOL.run(open, pdf_path, "wb")
+                elif cur is None:
+                    continue
+                elif kind == "data":
+                    cur["sha"].update(value)
+                    cur["size"] += len(value)
+                    cur["buf"].append(value)
+                    cur["buf_len"] += len(value)
+                    if cur["buf_len"] >= config.UPLOAD_CHUNK_SIZE:
+                        await DB_POOL.run(cur["fh"].write, b"".join(cur["buf"]))
+                        cur["buf"], cur["buf_len"] = [], 0
+                else:  # end of part
+                    await DB_POOL.run(cur["fh"].write, b"".join(cur["buf"]))
+                    await DB_POOL.run(cur.pop("fh").close)
+                    cur = None
+            events.clear()
+        parser.finalize()
+        if cur is not None:
+            raise HTTPException(400, detail="multipart body ended inside a file part")
+    except BaseException:
+        if cur is not None and "fh" in cur:
+            cur["fh"].close()
+        await DB_POOL.run(_remove, [f["pdf_path"] for f in saved])
+        raise
+    if not saved:
+        raise HTTPException(400, detail="no files uploaded")
+    return [{"document_id": f["document_id"], "filename": f["filename"], "pdf_path": f["pdf_path"],
+             "bytes": f["size"], "sha256": f["sha"].hexdigest()} for f in saved]
+
+@router.post("/ingest", tags=["ingest"], openapi_extra=UPLOAD_OPENAPI)
+async def ingest(request: Request, background_tasks: BackgroundTasks = None, webhook_url: str = None):
     """
-    Upload 1..n PDFs. Extract & index. Optional webhook_url to be notified when complete.
+    Upload 1..n PDFs (multipart "files" parts). Extract & index. Optional webhook_url to be notified when complete.
+    The body is parsed as it streams in; a declared or actual size past MAX_UPLOAD_BYTES is rejected with 413
+    before (or while) it is read.
     """
     METRICS.inc("ingest_count", 1)
-    saved_ids = []
-    db = SessionLocal()
-    vs = get_vectorstore()
-    for f in files:
-        content = await f.read()
-        file_id = str(uuid.uuid4())
-        filename = f.filename or f"{file_id}.pdf"
-        pdf_path = os.path.join("data", "uploads", f"{file_id}_{filename}")
-        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
-        with open(pdf_path, "wb") as fh:
-            fh.write(content)
-        # extract text and pages
-        full_text, pages = extract_pages_text(pdf_path)
-        # save full text
-        text_path = os.path.join("data", "texts", f"{file_id}.txt")
-        with open(text_path, "w", encoding="utf-8") as tf:
-            tf.write(full_text)
-        # chunk large pages
-        chunks = chunk_page_texts(pages)
-        # persist metadata to DB
-        doc = Document(
-            id=file_id,
-            filename=filename,
-            num_pages=len(pages),
-            path_pdf=pdf_path,
-            path_text=text_path
-        )
-        db.add(doc)
-        db.commit()
-        # persist chunks
-        chunk_docs_for_index = []
-        for c in chunks:
-            cid = str(uuid.uuid4())
-            ch = Chunk(
-                id=cid,
-                document_id=file_id,
-                page_no=c["page_no"],
-                char_start=c["char_start"],
-                char_end=c["char_end"],
-                text=c["text"]
-            )
-            db.add(ch)
-            # prepare for vectorstore
-            chunk_docs_for_index.append({
-                "document_id": file_id,
-                "page_no": c["page_no"],
-                "char_start": c["char_start"],
-                "char_end": c["char_end"],
-                "text": c["text"]
-            })
-        db.commit()
-        # index embeddings (could be backgrounded)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > config.MAX_UPLOAD_BYTES:
+        raise HTTPException(413, detail=f"upload exceeds {config.MAX_UPLOAD_BYTES} bytes")
+    uploads = await _receive_uploads(request)
+    # first use loads the model / index or spawns workers: keep it off the event loop
+    vs = await MODEL_POOL.run(get_vectorstore)
+    pipeline = await DB_POOL.run(get_embed_pipeline)
+
+    async def _one(u: dict):
+        file_id, filename, pdf_path = u["document_id"], u["filename"], u["pdf_path"]
+        text_path = os.path.join(config.TEXT_DIR, f"{file_id}.txt")
+        # a checkpoint dir marks the document as pending so a restart resumes its embedding
+        await DB_POOL.run(pipeline.mark_pending, file_id)
+        async with _file_slots:
+            # parse + chunk + page-batched DB commits in a worker process; it reports its stage timings
+            res = await PARSE_POOL.run(parse_and_store, file_id, filename, pdf_path, text_path)
+        for stage, seconds in res["timings"].items():
+            METRICS.observe("stage_duration_seconds", seconds, stage=stage)
+            METRICS.inc("ingest_chunks", res["chunks"], stage=stage)
+        logger.info("ingested %s (%d bytes, sha256=%s, %d pages, %d chunks)", filename, u["bytes"], u["sha256"],
+                    res["num_pages"], res["chunks"])
+        # embed on the pipeline's worker processes, then index
         def _index():
             try:
-                vs.add(chunk_docs_for_index)
+                index_document(vs, pipeline, file_id, n=res["chunks"])
             except Exception as e:
                 logger.exception("Vector store add failed: %s", e)
         if background_tasks:
             background_tasks.add_task(_index)
         else:
-            _index()
-        saved_ids.append(file_id)
+            await MODEL_POOL.run(_index)
+        return {"document_id": file_id, "filename": filename, "bytes": u["bytes"], "sha256": u["sha256"]}
+
+    saved = await asyncio.gather(*[_one(u) for u in uploads])
+    saved_ids = [s["document_id"] for s in saved]
     # optional webhook notify
     if webhook_url:
-        import asyncio, aiohttp
+        import aiohttp
         async def _emit():
             try:
                 async with aiohttp.ClientSession() as s:
@@ -94,6 +179,5 @@ async def ingest(files: List[UploadFile] = File(...), background_tasks: Backgrou
         if background_tasks:
             background_tasks.add_task(_emit)
         else:
-            import asyncio
             asyncio.create_task(_emit())
-    return {"document_ids": saved_ids}
+    return {"document_ids": saved_ids, "files": saved}
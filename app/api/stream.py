@@ -1,8 +1,6 @@
 # app/api/stream.py
 from fastapi import APIRouter, WebSocket
-from ..services.vectorstore import get_vectorstore
-from ..db import SessionLocal
-from ..models.chunks import Chunk
+from ..services.retrieval import aretrieve_chunks
 from ..core.logger import logger
 from ..core.metrics import METRICS
 import json, asyncio
@@ -25,14 +23,7 @@ async def ask_stream(ws: WebSocket):
         question = req.get("question")
         doc_ids = req.get("document_ids")
         top_k = req.get("top_k", 4)
-        vs = get_vectorstore()
-        hits_meta = vs.query(question, top_k=top_k, filter_docs=doc_ids)
-        db = SessionLocal()
-        hits = []
-        for h in hits_meta:
-            ch = db.query(Chunk).filter(Chunk.document_id == h["document_id"], Chunk.page_no == h["page_no"]).first()
-            if ch:
-                hits.append({"document_id": ch.document_id, "page_no": ch.page_no, "text": ch.text})
+        hits = await aretrieve_chunks(question, document_ids=doc_ids, top_k=top_k)
         # simple simulated streaming: send each chunk's first 400 chars
         for h in hits:
             snippet = h["text"][:400] if h["text"] else ""
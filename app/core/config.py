@@ -4,14 +4,75 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "..", "data")
-UPLOAD_DIR = os.path.join(BASE_DIR, "..", "data", "uploads")
-TEXT_DIR = os.path.join(BASE_DIR, "..", "data", "texts")
-FAISS_INDEX_PATH = os.path.join(BASE_DIR, "..", "data", "faiss.index")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(BASE_DIR, "..", "data"))
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+TEXT_DIR = os.path.join(DATA_DIR, "texts")
+FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss.index")
 FAISS_META_PATH = FAISS_INDEX_PATH + ".meta.json"
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 OPENAI_KEY = os.getenv("OPENAI_API_KEY", None)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2500"))  # tokens of retrieved context per prompt
+# risk rule packs (*.json / *.yaml), re-scanned for changes at most every RISK_RULES_RELOAD_SECONDS
+RISK_RULES_DIR = os.getenv("RISK_RULES_DIR", os.path.join(BASE_DIR, "..", "prompts", "risk_rules"))
+RISK_RULES_RELOAD_SECONDS = float(os.getenv("RISK_RULES_RELOAD_SECONDS", "5"))
+
+# vector storage: "none" (float32 flat), "fp16", "int8" (scalar quantization) or "pq" (product quantization)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+PQ_M = int(os.getenv("PQ_M", "48"))  # sub-quantizers, must divide the embedding dim (384 for MiniLM)
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+QUANT_TRAIN_MIN = int(os.getenv("QUANT_TRAIN_MIN", "1000"))  # vectors needed before an int8 or PQ index is trained
+EXACT_RERANK_FACTOR = int(os.getenv("EXACT_RERANK_FACTOR", "4"))  # candidate multiplier for the exact re-rank pass
+
+# retrieval: "l2" over raw embeddings or "ip" (cosine) over L2-normalized embeddings
+VECTOR_METRIC = os.getenv("VECTOR_METRIC", "ip").lower()
+# >1 splits the index across worker processes searched in parallel; documents are placed by hash of document_id
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "30"))  # seconds to wait for a shard reply
+# cross-encoder re-ranking of a wider candidate set; set RERANK_MODEL="" to disable
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RETRIEVE_CANDIDATES = int(os.getenv("RETRIEVE_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))  # cached question embeddings; 0 disables
+
+# /api/ask/batch
+ASK_BATCH_MAX_PAIRS = int(os.getenv("ASK_BATCH_MAX_PAIRS", "2000"))  # questions x documents per request
+ASK_BATCH_LLM_CONCURRENCY = int(os.getenv("ASK_BATCH_LLM_CONCURRENCY", "8"))  # answers in flight per request
+
+# ingest: uploads are streamed to disk in UPLOAD_CHUNK_SIZE pieces
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))  # per request, all files
+INGEST_MAX_CONCURRENT_FILES = int(os.getenv("INGEST_MAX_CONCURRENT_FILES", "4"))  # across all requests
+INGEST_DB_BATCH_PAGES = int(os.getenv("INGEST_DB_BATCH_PAGES", "16"))  # pages of chunk rows per transaction
+# ingest embedding: length-sorted batches on worker processes, checkpointed per batch
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))  # processes; 0 embeds in the API process
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))  # per worker; 0 splits the cores evenly
+EMBED_CHECKPOINT_DIR = os.path.join(DATA_DIR, "embed_checkpoints")
+
+# executors: bounded pools per kind of blocking work; MAX_PENDING caps queued+running tasks before 503
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))  # Starlette's pool for sync endpoints
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))
+DB_MAX_PENDING = int(os.getenv("DB_MAX_PENDING", "64"))
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "2"))
+MODEL_MAX_PENDING = int(os.getenv("MODEL_MAX_PENDING", "32"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+LLM_MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "64"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))  # processes; 0 parses on a single thread
+PARSE_MAX_PENDING = int(os.getenv("PARSE_MAX_PENDING", "16"))
+
+# metadata DB (DATABASE_URL, see app/db.py): connection pool and SQLite pragmas
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; Postgres only
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(TEXT_DIR, exist_ok=True)
-os.makedirs(os.path.join(BASE_DIR, "..", "data"), exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
@@ -0,0 +1,94 @@
+# app/core/executors.py
+import asyncio
+import functools
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+from . import config
+from .logger import logger
+from .metrics import METRICS
+
+HELP_QUEUED = "Tasks waiting for a worker"
+HELP_RUNNING = "Tasks currently executing"
+
+class BoundedExecutor:
+    """
+    Wraps a thread or process pool with a cap on outstanding tasks.
+    Await run() from the event loop; when max_pending tasks are already queued or running
+    the call fails fast with 503 instead of growing an unbounded backlog.
+    """
+
+    def __init__(self, name: str, executor, max_pending: int):
+        self.name = name
+        self.max_pending = max_pending
+        self._executor = executor
+        self._pending = 0  # only touched from the event loop thread
+        self._threads = isinstance(executor, ThreadPoolExecutor)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _tracked(self, fn, *args, **kwargs):
+        # runs on the worker thread
+        METRICS.gauge_add("executor_queued", -1, pool=self.name)
+        METRICS.gauge_add("executor_running", 1, pool=self.name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            METRICS.gauge_add("executor_running", -1, pool=self.name)
+
+    async def run(self, fn, *args, **kwargs):
+        if self._pending >= self.max_pending:
+            METRICS.inc("executor_rejected", 1, pool=self.name)
+            raise HTTPException(503, detail=f"{self.name} executor busy, retry later")
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            if self._threads:
+                METRICS.gauge_add("executor_queued", 1, pool=self.name)
+                call = functools.partial(self._tracked, fn, *args, **kwargs)
+            else:
+                # worker processes cannot report into this process' metrics
+                call = functools.partial(fn, *args, **kwargs)
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+def _make_parse_executor():
+    if config.PARSE_WORKERS <= 0:
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="parse")
+    # spawn: forking the multi-threaded API process can copy held locks into the child
+    return ProcessPoolExecutor(max_workers=config.PARSE_WORKERS, mp_context=mp.get_context("spawn"))
+
+# SQLite/Postgres access and file I/O
+DB_POOL = BoundedExecutor("db", ThreadPoolExecutor(max_workers=config.DB_WORKERS, thread_name_prefix="db"), config.DB_MAX_PENDING)
+# embedding, FAISS search and re-ranking; torch/faiss release the GIL so a few threads saturate the cores
+MODEL_POOL = BoundedExecutor("model", ThreadPoolExecutor(max_workers=config.MODEL_WORKERS, thread_name_prefix="model"), config.MODEL_MAX_PENDING)
+# answer generation: prompt assembly (tokenizing), outbound LLM calls that spend their time
+# waiting on the network, and the extractive fallback
+LLM_POOL = BoundedExecutor("llm", ThreadPoolExecutor(max_workers=config.LLM_WORKERS, thread_name_prefix="llm"), config.LLM_MAX_PENDING)
+# PyMuPDF parsing holds the GIL, so it gets separate processes
+PARSE_POOL = BoundedExecutor("parse", _make_parse_executor(), config.PARSE_MAX_PENDING)
+
+ALL_POOLS = (DB_POOL, MODEL_POOL, LLM_POOL, PARSE_POOL)
+
+for _pool in ALL_POOLS:
+    METRICS.register_gauge(f"executor_pending_{_pool.name}", (lambda p: lambda: p.pending)(_pool),
+                           f"Tasks submitted to the {_pool.name} executor and not yet finished")
+
+def configure_default_threadpool():
+    """
+    Size the threadpool Starlette uses for sync endpoints and dependencies.
+    Must run inside the event loop (startup event).
+    """
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.THREADPOOL_SIZE
+    logger.info("Default threadpool limited to %d threads", config.THREADPOOL_SIZE)
+
+def shutdown_executors():
+    for pool in ALL_POOLS:
+        pool.shutdown()
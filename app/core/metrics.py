@@ -1,28 +1,279 @@
 # app/core/metrics.py
+import time
+import weakref
+import threading
 from threading import Lock
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+# seconds; covers sub-ms FAISS searches up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "contract_intel_"
+
+HELP = {
+    "requests": "HTTP requests handled",
+    "ingest_count": "Ingest calls",
+    "extract_count": "Extract calls",
+    "ask_count": "Ask calls (HTTP and WebSocket)",
+    "audit_count": "Audit calls",
+    "http_request_duration_seconds": "HTTP request latency by route",
+    "http_requests_in_flight": "HTTP requests currently being handled",
+    "stage_duration_seconds": "Latency of internal pipeline stages",
+    "cache_hits": "Cache hits",
+    "cache_misses": "Cache misses",
+    "cache_hit_ratio": "Cache hits / lookups since start",
+    "ingest_chunks": "Chunks processed by each ingest stage",
+    "ingest_chunks_per_second": "Ingest chunks per second of stage time, by stage",
+    "risk_rule_scans": "Texts scanned by each risk rule",
+    "risk_rule_matches": "Matches per risk rule",
+    "risk_rule_scan_seconds": "Cumulative regex time per risk rule",
+}
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _key(name: str, labels: dict) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+class _Shard:
+    """
+    Per-thread accumulators. Only the owning thread writes, so updates need no lock;
+    readers copy the dicts (atomic under the GIL) and merge all shards.
+    """
+    __slots__ = ("counters", "gauges", "hists")
+
+    def __init__(self):
+        self.counters: Dict[LabelKey, float] = {}
+        self.gauges: Dict[LabelKey, float] = {}
+        self.hists: Dict[LabelKey, list] = {}  # [bucket counts..., +Inf count, sum]
+
+    def fold(self, other: "_Shard"):
+        for k, v in other.counters.items():
+            self.counters[k] = self.counters.get(k, 0) + v
+        for k, v in other.gauges.items():
+            self.gauges[k] = self.gauges.get(k, 0) + v
+        for k, v in other.hists.items():
+            acc = self.hists.setdefault(k, [0] * len(v))
+            for i, x in enumerate(v):
+                acc[i] += x
+
+class _ThreadToken:
+    """Lives only in the thread-local; collected when its thread exits."""
 
 class Metrics:
     def __init__(self):
-        self._lock = Lock()
-        self.requests = 0
-        self.ingest_count = 0
-        self.extract_count = 0
-        self.ask_count = 0
-        self.audit_count = 0
-
-    def inc(self, name: str, n: int = 1):
+        self._lock = Lock()  # guards shard registration/retirement and callback gauges only
+        self._local = threading.local()
+        self._shards = []
+        # totals of shards whose threads have exited (worker threads come and go)
+        self._retired = _Shard()
+        self._gauge_fns: Dict[str, Callable[[], float]] = {}
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            token = _ThreadToken()
+            self._local.shard, self._local.token = shard, token
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(token, self._retire, shard)
+        return shard
+
+    def _retire(self, shard: _Shard):
         with self._lock:
-            if hasattr(self, name):
-                setattr(self, name, getattr(self, name) + n)
+            self._retired.fold(shard)
+            self._shards.remove(shard)
 
-    def get_snapshot(self):
+    # ----------------------------------------
+    # Recording
+    # ----------------------------------------
+    def inc(self, name: str, n: int = 1, **labels):
+        c = self._shard().counters
+        k = _key(name, labels)
+        c[k] = c.get(k, 0) + n
+
+    def gauge_add(self, name: str, n: float = 1, **labels):
+        """Up/down gauge; each thread keeps its own delta and the export sums them."""
+        g = self._shard().gauges
+        k = _key(name, labels)
+        g[k] = g.get(k, 0) + n
+
+    def observe(self, name: str, value: float, **labels):
+        h = self._shard().hists
+        k = _key(name, labels)
+        acc = h.get(k)
+        if acc is None:
+            acc = h[k] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        for i, b in enumerate(LATENCY_BUCKETS):
+            if value <= b:
+                acc[i] += 1
+                break
+        else:
+            acc[len(LATENCY_BUCKETS)] += 1
+        acc[-1] += value
+
+    @contextmanager
+    def timer(self, stage: str):
+        """with METRICS.timer("embed"): ... records into stage_duration_seconds{stage=...}"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - t0, stage=stage)
+
+    def cache(self, name: str, hit: bool):
+        self.inc("cache_hits" if hit else "cache_misses", 1, cache=name)
+
+    def register_gauge(self, name: str, fn: Callable[[], float], help: str = None):
+        """Gauge computed at export time, e.g. index size."""
         with self._lock:
-            return {
-                "requests": self.requests,
-                "ingest_count": self.ingest_count,
-                "extract_count": self.extract_count,
-                "ask_count": self.ask_count,
-                "audit_count": self.audit_count
+            self._gauge_fns[name] = fn
+        if help:
+            HELP.setdefault(name, help)
+
+    # ----------------------------------------
+    # Export
+    # ----------------------------------------
+    def _merged(self):
+        # copy under the lock so a shard cannot be retired (and counted twice) mid-scrape
+        with self._lock:
+            copies = []
+            for s in self._shards + [self._retired]:
+                c = _Shard()
+                c.counters, c.gauges = s.counters.copy(), s.gauges.copy()
+                c.hists = {k: list(v) for k, v in s.hists.copy().items()}
+                copies.append(c)
+            gauge_fns = dict(self._gauge_fns)
+        total = _Shard()
+        for c in copies:
+            total.fold(c)
+        counters, gauges, hists = total.counters, total.gauges, total.hists
+        for name, fn in gauge_fns.items():
+            try:
+                gauges[(name, ())] = float(fn())
+            except Exception:
+                pass
+        for (name, labels), hits in list(counters.items()):
+            if name == "cache_hits":
+                misses = counters.get(("cache_misses", labels), 0)
+                gauges[("cache_hit_ratio", labels)] = hits / (hits + misses) if hits + misses else 0.0
+            elif name == "ingest_chunks":
+                busy = hists.get(("stage_duration_seconds", labels))
+                gauges[("ingest_chunks_per_second", labels)] = hits / busy[-1] if busy and busy[-1] else 0.0
+        return counters, gauges, hists
+
+    def get_snapshot(self):
+        counters, gauges, hists = self._merged()
+        out = {name: int(counters.get((name, ()), 0))
+               for name in ("requests", "ingest_count", "extract_count", "ask_count", "audit_count")}
+        for (name, labels), acc in sorted(hists.items()):
+            count = sum(acc[:-1])
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            out.setdefault(name, {})[label] = {
+                "count": count,
+                "mean_ms": round(1000 * acc[-1] / count, 3) if count else None,
             }
+        for (name, labels), v in sorted(gauges.items()):
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            out.setdefault(name, {})[label] = v
+        return out
+
+    def render_prometheus(self) -> str:
+        counters, gauges, hists = self._merged()
+        lines = []
+
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items) + "}"
+
+        def header(name, kind, suffix=""):
+            # counters are exposed as <name>_total, and HELP/TYPE must use the sample name
+            full = PREFIX + name + suffix
+            if name in HELP:
+                lines.append(f"# HELP {full} {HELP[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        by_name = {}
+        for (name, labels), v in counters.items():
+            by_name.setdefault(name, []).append((labels, v))
+        for name in sorted(by_name):
+            full = header(name, "counter", "_total")
+            for labels, v in sorted(by_name[name]):
+                lines.append(f"{full}{fmt_labels(labels)} {v}")
+
+        by_name = {}
+        for (name, labels), v in gauges.items():
+            by_name.setdefault(name, []).append((labels, v))
+        for name in sorted(by_name):
+            full = header(name, "gauge")
+            for labels, v in sorted(by_name[name]):
+                lines.append(f"{full}{fmt_labels(labels)} {v}")
+
+        by_name = {}
+        for (name, labels), acc in hists.items():
+            by_name.setdefault(name, []).append((labels, acc))
+        for name in sorted(by_name):
+            full = header(name, "histogram")
+            for labels, acc in sorted(by_name[name]):
+                cum = 0
+                for b, n in zip(LATENCY_BUCKETS, acc):
+                    cum += n
+                    lines.append(f"{full}_bucket{fmt_labels(labels, [('le', repr(b))])} {cum}")
+                cum += acc[len(LATENCY_BUCKETS)]
+                lines.append(f"{full}_bucket{fmt_labels(labels, [('le', '+Inf')])} {cum}")
+                lines.append(f"{full}_sum{fmt_labels(labels)} {acc[-1]}")
+                lines.append(f"{full}_count{fmt_labels(labels)} {cum}")
+        return "\n".join(lines) + "\n"
 
 METRICS = Metrics()
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request count, per-route latency histogram and in-flight gauge.
+    Routes are labelled by their path template so ids do not explode cardinality.
+    """
+
+    def __init__(self, app, routes_app=None):
+        self.app = app
+        self.routes_app = routes_app
+        self._templates: Dict[Tuple[str, str], str] = {}
+
+    def _route(self, scope) -> str:
+        key = (scope.get("method", "WS"), scope["path"])
+        tpl = self._templates.get(key)
+        if tpl is None:
+            from starlette.routing import Match
+            tpl = "unmatched"
+            for r in getattr(self.routes_app, "routes", []):
+                match, _ = r.matches(scope)
+                if match == Match.FULL:
+                    tpl = getattr(r, "path", tpl)
+                    break
+            if len(self._templates) < 10000:
+                self._templates[key] = tpl
+        return tpl
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        route = self._route(scope)
+        method = scope.get("method", "WS")
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        METRICS.inc("requests")
+        METRICS.gauge_add("http_requests_in_flight", 1, route=route)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            METRICS.gauge_add("http_requests_in_flight", -1, route=route)
+            METRICS.observe("http_request_duration_seconds", time.perf_counter() - t0,
+                            route=route, method=method, status=status["code"] if scope["type"] == "http" else "ws")
@@ -1,15 +1,62 @@
 # app/db.py
-from sqlalchemy import create_engine, Column, String, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, Column, String, Integer, Text, DateTime, ForeignKey
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 from datetime import datetime
 import os
+from .core import config
+from .core.metrics import METRICS
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./data/meta.db")
 
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+def _make_engine(url: str):
+    pool_args = {
+        "poolclass": QueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    }
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_recycle=config.DB_POOL_RECYCLE, pool_pre_ping=True, **pool_args)
+    eng = create_engine(url, connect_args={"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}, **pool_args)
+
+    @event.listens_for(eng, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL lets readers proceed while ingest writes; NORMAL sync is safe under WAL
+        cur = dbapi_conn.cursor()
+        cur.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+    return eng
+
+engine = _make_engine(DB_URL)
+METRICS.register_gauge("db_pool_checked_out", lambda: engine.pool.checkedout(), "DB connections currently checked out")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
+def get_db():
+    """
+    FastAPI dependency: one session per request, always closed so its connection returns to the pool.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@contextmanager
+def session_scope():
+    """Session for code outside a request (executors, background jobs, scripts)."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def init_db():
     from .models.document import Document
     from .models.chunks import Chunk
@@ -2,7 +2,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .api import ingest, extract, ask, audit, stream, admin, webhook as webhook_router
-from .core.metrics import METRICS
+from .core.metrics import METRICS, MetricsMiddleware
+from .core.executors import configure_default_threadpool, shutdown_executors
+from .services.embed_pipeline import resume_pending, shutdown_embed_pipeline
+from .services.prompt_builder import preload_encoding
+import asyncio
+import threading
 
 app = FastAPI(title="Contract Intelligence API", version="0.1")
 
@@ -12,6 +17,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, routes_app=app)
+
+@app.on_event("startup")
+async def _startup():
+    configure_default_threadpool()
+    # tiktoken may fetch its BPE file on first use; do it before serving, off the loop
+    await asyncio.get_running_loop().run_in_executor(None, preload_encoding)
+    # finish documents whose embedding was interrupted by the last shutdown
+    threading.Thread(target=resume_pending, name="embed-resume", daemon=True).start()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    shutdown_executors()
+    shutdown_embed_pipeline()
 
 # include routers
 app.include_router(ingest.router, prefix="/api")
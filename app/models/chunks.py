@@ -1,5 +1,5 @@
 # app/models/chunks.py
-from sqlalchemy import Column, String, Integer, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, Index
 from ..db import Base
 
 class Chunk(Base):
@@ -10,3 +10,10 @@ class Chunk(Base):
     char_start = Column(Integer)
     char_end = Column(Integer)
     text = Column(Text)
+
+    # lookups by (document, page) and by (document, char offset) from vector store hits;
+    # existing databases get these from migrations/versions/0002_chunk_lookup_indexes.py
+    __table_args__ = (
+        Index("ix_chunks_document_page", "document_id", "page_no"),
+        Index("ix_chunks_document_char_start", "document_id", "char_start"),
+    )
@@ -4,6 +4,7 @@ from typing import List, Optional, Dict, Any
 
 class IngestResponse(BaseModel):
     document_ids: List[str]
+    files: List[Dict[str, Any]] = []  # {document_id, filename, bytes, sha256}
 
 class ExtractResponse(BaseModel):
     document_id: str
@@ -25,9 +26,15 @@ class AskRequest(BaseModel):
     top_k: int = 4
     webhook_url: Optional[str] = None
 
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    document_ids: Optional[List[str]] = None  # each question is answered per document; None = whole corpus
+    top_k: int = 4
+
 class AskResponse(BaseModel):
     answer: str
     citations: List[Dict[str, Any]] = []
+    usage: Dict[str, int] = {}
 
 class AuditFinding(BaseModel):
     document_id: str
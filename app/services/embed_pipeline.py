@@ -0,0 +1,289 @@
+# app/services/embed_pipeline.py
+import os
+import json
+import time
+import shutil
+import multiprocessing as mp
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, List, Dict, Any, Optional
+import numpy as np
+from ..core import config
+from ..core.logger import logger
+from ..core.metrics import METRICS
+
+# ----------------------------------------
+# Worker process side
+# ----------------------------------------
+_worker_model = None
+_worker_normalize = False
+
+def _init_worker(model_name: str, normalize: bool, torch_threads: int):
+    """
+    Runs once per worker process: pin torch's intra-op threads so N workers do not
+    oversubscribe the cores, then load the model.
+    """
+    global _worker_model, _worker_normalize
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    torch.set_num_threads(torch_threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+    _worker_normalize = normalize
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False,
+        normalize_embeddings=_worker_normalize
+    ).astype("float32")
+
+# ----------------------------------------
+# Pipeline
+# ----------------------------------------
+class EmbeddingPipeline:
+    """
+    Embeds a document's chunks for indexing. Chunks are consumed as a stream; every window of
+    batch_size * workers * 4 chunks is sorted by length and cut into batches (less padding per
+    batch), which run on EMBED_WORKERS processes. Each finished batch is written to
+    EMBED_CHECKPOINT_DIR/<document_id>/ so an interrupted document resumes where it stopped.
+    """
+
+    def __init__(self, workers: int = None, batch_size: int = None, checkpoint_dir: str = None,
+                 model_name: str = None, metric: str = None):
+        self.workers = config.EMBED_WORKERS if workers is None else workers
+        self.batch_size = max(1, batch_size or config.EMBED_BATCH_SIZE)
+        self.checkpoint_dir = checkpoint_dir or config.EMBED_CHECKPOINT_DIR
+        self.model_name = model_name or config.EMBED_MODEL
+        self.normalize = (metric or config.VECTOR_METRIC).lower() == "ip"
+        self._executor = None
+        self._executor_lock = Lock()
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    threads = config.EMBED_TORCH_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                        initializer=_init_worker, initargs=(self.model_name, self.normalize, threads),
+                    )
+                    logger.info("Embedding pipeline: %d workers x %d torch threads", self.workers, threads)
+        return self._executor
+
+    # ----------------------------------------
+    # Checkpoints
+    # ----------------------------------------
+    def _doc_dir(self, document_id: str) -> str:
+        return os.path.join(self.checkpoint_dir, document_id)
+
+    def _load_checkpoint(self, document_id: str, n: int) -> Dict[int, np.ndarray]:
+        """Return {chunk position: vector} for batches already embedded for this document."""
+        d = self._doc_dir(document_id)
+        manifest = os.path.join(d, "manifest.json")
+        expected = {"chunks": n, "model": self.model_name, "normalize": self.normalize}
+        try:
+            with open(manifest, "r", encoding="utf-8") as fh:
+                saved = json.load(fh)
+        except (OSError, ValueError):
+            saved = None
+        if saved != expected:
+            # missing manifest, or chunking/model/metric changed since the checkpoint was taken
+            if saved is not None:
+                logger.info("Discarding embedding checkpoint for %s: %s != %s", document_id, saved, expected)
+            shutil.rmtree(d, ignore_errors=True)
+        os.makedirs(d, exist_ok=True)
+        with open(manifest, "w", encoding="utf-8") as fh:
+            json.dump(expected, fh)
+        done = {}
+        for name in os.listdir(d):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                data = np.load(os.path.join(d, name))
+                for pos, vec in zip(data["pos"], data["emb"]):
+                    done[int(pos)] = vec
+            except Exception:
+                logger.warning("Ignoring unreadable embedding checkpoint %s/%s", d, name)
+        return done
+
+    def _save_batch(self, document_id: str, pos: List[int], emb: np.ndarray):
+        d = self._doc_dir(document_id)
+        tmp = os.path.join(d, f"b{pos[0]:08d}.npz.tmp")
+        with open(tmp, "wb") as fh:
+            np.savez(fh, pos=np.asarray(pos, dtype="int64"), emb=emb)
+        os.replace(tmp, os.path.join(d, f"b{pos[0]:08d}.npz"))
+
+    def mark_pending(self, document_id: str):
+        os.makedirs(self._doc_dir(document_id), exist_ok=True)
+
+    def clear(self, document_id: str):
+        """Drop a document's checkpoint once its vectors are in the index."""
+        shutil.rmtree(self._doc_dir(document_id), ignore_errors=True)
+
+    def pending_documents(self) -> List[str]:
+        return sorted(n for n in os.listdir(self.checkpoint_dir) if os.path.isdir(self._doc_dir(n)))
+
+    # ----------------------------------------
+    # Embedding
+    # ----------------------------------------
+    def embed_document(self, document_id: str, chunks: Iterable[Dict[str, Any]], n: int,
+                       embed_fn=None) -> np.ndarray:
+        """
+        Embed n chunks (dicts with "text") and return one row per chunk in input order.
+        embed_fn is used in-process when EMBED_WORKERS is 0 (normally the store's embed).
+        """
+        t0 = time.perf_counter()
+        done = self._load_checkpoint(document_id, n)
+        resumed = len(done)
+        out: List[Optional[np.ndarray]] = [None] * n
+        for pos, vec in done.items():
+            if pos < n:
+                out[pos] = vec
+        inflight = {}
+        max_inflight = max(1, self.workers) * 2
+
+        def _collect(futures):
+            for fut in futures:
+                pos = inflight.pop(fut)
+                try:
+                    emb = fut.result()
+                except BrokenProcessPool:
+                    # a worker died (e.g. OOM); start a fresh pool next time, finished batches are kept
+                    self._executor = None
+                    raise
+                self._save_batch(document_id, pos, emb)
+                for p, vec in zip(pos, emb):
+                    out[p] = vec
+
+        def _flush(window):
+            window.sort(key=lambda item: len(item[1]))
+            for start in range(0, len(window), self.batch_size):
+                batch = window[start:start + self.batch_size]
+                pos = [p for p, _ in batch]
+                texts = [t for _, t in batch]
+                if self.workers <= 0:
+                    emb = embed_fn(texts)
+                    self._save_batch(document_id, pos, emb)
+                    for p, vec in zip(pos, emb):
+                        out[p] = vec
+                    continue
+                while len(inflight) >= max_inflight:
+                    finished, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                    _collect(finished)
+                inflight[self._pool().submit(_encode_batch, texts)] = pos
+
+        window = []
+        window_size = self.batch_size * max(1, self.workers) * 4
+        for pos, c in enumerate(chunks):
+            if pos >= n:
+                break
+            if out[pos] is None:
+                window.append((pos, c.get("text", "")))
+            if len(window) >= window_size:
+                _flush(window)
+                window = []
+        if window:
+            _flush(window)
+        if inflight:
+            _collect(wait(list(inflight))[0])
+
+        missing = [p for p, v in enumerate(out) if v is None]
+        if missing:
+            raise RuntimeError(f"{len(missing)} chunks of {document_id} were not embedded")
+        elapsed = time.perf_counter() - t0
+        METRICS.observe("stage_duration_seconds", elapsed, stage="embed_document")
+        METRICS.inc("ingest_chunks", n - resumed, stage="embed_document")
+        logger.info("Embedded %s: %d chunks (%d from checkpoint) in %.2fs, %.1f chunks/s",
+                    document_id, n, resumed, elapsed, (n - resumed) / elapsed if elapsed else 0.0)
+        return np.vstack(out).astype("float32") if n else np.zeros((0, 0), dtype="float32")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+def iter_document_chunks(document_id: str, meta: List[Dict[str, Any]], page_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a document's chunks from the DB in parse order, one short session per page of rows
+    so no connection is held while embedding. Appends each chunk's index metadata to meta.
+    """
+    from sqlalchemy import or_, and_
+    from ..db import session_scope
+    from ..models.chunks import Chunk
+    last = None
+    while True:
+        with session_scope() as db:
+            q = db.query(Chunk.page_no, Chunk.char_start, Chunk.char_end, Chunk.text).filter(Chunk.document_id == document_id)
+            if last is not None:
+                q = q.filter(or_(Chunk.page_no > last[0], and_(Chunk.page_no == last[0], Chunk.char_start > last[1])))
+            rows = q.order_by(Chunk.page_no, Chunk.char_start).limit(page_size).all()
+        for page_no, char_start, char_end, text in rows:
+            meta.append({"document_id": document_id, "page_no": page_no, "char_start": char_start, "char_end": char_end})
+            yield {"text": text or ""}
+        if len(rows) < page_size:
+            return
+        last = (rows[-1][0], rows[-1][1])
+
+def count_document_chunks(document_id: str) -> int:
+    from sqlalchemy import func
+    from ..db import session_scope
+    from ..models.chunks import Chunk
+    with session_scope() as db:
+        return db.query(func.count(Chunk.id)).filter(Chunk.document_id == document_id).scalar() or 0
+
+def index_document(vs, pipeline: EmbeddingPipeline, document_id: str, n: int = None):
+    """
+    Embed (resuming from any checkpoint) and add one document's chunks to the vector store,
+    then drop the checkpoint. Chunks are streamed from the DB; n is their count if known.
+    """
+    n = count_document_chunks(document_id) if n is None else n
+    if not n:
+        pipeline.clear(document_id)
+        return
+    meta: List[Dict[str, Any]] = []
+    emb = pipeline.embed_document(document_id, iter_document_chunks(document_id, meta), n, embed_fn=vs.embed)
+    if len(meta) != n:
+        raise RuntimeError(f"{document_id}: expected {n} chunks, read {len(meta)}")
+    with METRICS.timer("index_add"):
+        vs.add_embeddings(emb, meta)
+    METRICS.inc("ingest_chunks", n, stage="index_add")
+    pipeline.clear(document_id)
+
+def resume_pending(vs=None, pipeline: EmbeddingPipeline = None):
+    """
+    Finish documents whose embedding was interrupted (checkpoint dir still present),
+    reloading their chunks from the DB. Runs at startup.
+    """
+    from .vectorstore import get_vectorstore
+    pipeline = pipeline or get_embed_pipeline()
+    pending = pipeline.pending_documents()
+    if not pending:
+        return
+    vs = vs or get_vectorstore()
+    for document_id in pending:
+        try:
+            if vs.has_document(document_id):
+                pipeline.clear(document_id)
+                continue
+            logger.info("Resuming embedding for %s", document_id)
+            index_document(vs, pipeline, document_id)
+        except Exception as e:
+            logger.exception("Resume of %s failed: %s", document_id, e)
+
+_pipeline = None
+_pipeline_lock = Lock()
+
+def get_embed_pipeline() -> EmbeddingPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = EmbeddingPipeline()
+    return _pipeline
+
+def shutdown_embed_pipeline():
+    if _pipeline is not None:
+        _pipeline.shutdown()
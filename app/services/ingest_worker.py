@@ -0,0 +1,57 @@
+# app/services/ingest_worker.py
+import time
+import uuid
+from typing import List, Dict, Any
+from ..core import config
+from ..db import session_scope
+from ..models.document import Document
+from ..models.chunks import Chunk
+from .pdf_loader import parse_to_text_file
+
+def parse_and_store(file_id: str, filename: str, pdf_path: str, text_path: str) -> Dict[str, Any]:
+    """
+    Parse a PDF page by page and commit its chunk rows every INGEST_DB_BATCH_PAGES pages, so
+    neither this process nor the API process ever holds the whole document's chunks.
+    Top-level so it can run in a parse worker process; stage timings are returned for the
+    caller to record. On failure the document's rows are removed again.
+    Returns {"num_pages", "chunks", "timings": {"pdf_parse", "chunk", "db_write"}}.
+    """
+    timings = {"pdf_parse": 0.0, "chunk": 0.0, "db_write": 0.0}
+    state = {"rows": [], "pages": 0}
+
+    def _flush():
+        if not state["rows"]:
+            return
+        t0 = time.perf_counter()
+        with session_scope() as db:
+            db.add_all(state["rows"])
+            db.commit()
+        timings["db_write"] += time.perf_counter() - t0
+        state["rows"], state["pages"] = [], 0
+
+    def _on_chunks(chunks: List[dict]):
+        state["rows"].extend(Chunk(id=str(uuid.uuid4()), document_id=file_id, **c) for c in chunks)
+        state["pages"] += 1
+        if state["pages"] >= config.INGEST_DB_BATCH_PAGES:
+            _flush()
+
+    t0 = time.perf_counter()
+    with session_scope() as db:
+        db.add(Document(id=file_id, filename=filename, num_pages=0, path_pdf=pdf_path, path_text=text_path))
+        db.commit()
+    timings["db_write"] += time.perf_counter() - t0
+    try:
+        num_pages, num_chunks = parse_to_text_file(pdf_path, text_path, _on_chunks, timings)
+        _flush()
+        t0 = time.perf_counter()
+        with session_scope() as db:
+            db.query(Document).filter(Document.id == file_id).update({"num_pages": num_pages})
+            db.commit()
+        timings["db_write"] += time.perf_counter() - t0
+    except BaseException:
+        with session_scope() as db:
+            db.query(Chunk).filter(Chunk.document_id == file_id).delete()
+            db.query(Document).filter(Document.id == file_id).delete()
+            db.commit()
+        raise
+    return {"num_pages": num_pages, "chunks": num_chunks, "timings": timings}
@@ -1,8 +1,9 @@
 # app/services/llm_client.py
 
 import os
-from ..core.config import OPENAI_KEY
+from ..core.config import OPENAI_KEY, LLM_MODEL
 from ..core.logger import logger
+from ..core.metrics import METRICS
 
 OPENAI_ENABLED = bool(OPENAI_KEY)
 
@@ -19,12 +20,13 @@ def call_openai_completion(prompt: str, max_tokens: int = 300, temperature: floa
         openai.api_key = OPENAI_KEY
 
         # Use ChatCompletion instead of Completion
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",  # updated from deprecated text-davinci-003
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        with METRICS.timer("llm"):
+            response = openai.ChatCompletion.create(
+                model=LLM_MODEL,  # gpt-3.5-turbo by default; updated from deprecated text-davinci-003
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
 
         # Extract the generated text
         text = response['choices'][0]['message']['content'].strip()
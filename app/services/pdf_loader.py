@@ -1,22 +1,65 @@
 # app/services/pdf_loader.py
+import time
 import fitz  # PyMuPDF
-from typing import Tuple, List
+from typing import Tuple, List, Iterator, Dict, Callable
+from ..core.metrics import METRICS
+
+def iter_pages(pdf_path: str, timings: Dict[str, float] = None) -> Iterator[dict]:
+    """
+    Yield one page at a time: {page_no, char_start, char_end, text}, with char ranges relative
+    to the concatenated text. Only the current page's text is held in memory.
+    Parse time (excluding the consumer's time between pages) is added to timings["pdf_parse"].
+    """
+    parse_s = 0.0
+    t0 = time.perf_counter()
+    doc = fitz.open(pdf_path)
+    try:
+        char_cursor = 0
+        for i in range(doc.page_count):
+            page = doc.load_page(i)
+            text = page.get_text("text") or ""
+            start = char_cursor
+            end = start + len(text)
+            char_cursor = end
+            parse_s += time.perf_counter() - t0
+            yield {"page_no": i+1, "char_start": start, "char_end": end, "text": text}
+            t0 = time.perf_counter()
+    finally:
+        doc.close()
+        if timings is not None:
+            timings["pdf_parse"] = timings.get("pdf_parse", 0.0) + parse_s
 
 def extract_pages_text(pdf_path: str) -> Tuple[str, List[dict]]:
     """
     Return full_text and list of page-chunks: text per page with char ranges relative to concatenated text.
     """
-    doc = fitz.open(pdf_path)
-    pages = []
-    all_text_parts = []
-    char_cursor = 0
-    for i in range(doc.page_count):
-        page = doc.load_page(i)
-        text = page.get_text("text") or ""
-        start = char_cursor
-        end = start + len(text)
-        pages.append({"page_no": i+1, "char_start": start, "char_end": end, "text": text})
-        all_text_parts.append(text)
-        char_cursor = end
-    full_text = "\n".join(all_text_parts)
+    timings = {}
+    pages = list(iter_pages(pdf_path, timings))
+    METRICS.observe("stage_duration_seconds", timings["pdf_parse"], stage="pdf_parse")
+    full_text = "\n".join(p["text"] for p in pages)
     return full_text, pages
+
+def parse_to_text_file(pdf_path: str, text_path: str, on_chunks: Callable[[List[dict]], None],
+                       timings: Dict[str, float] = None) -> Tuple[int, int]:
+    """
+    Parse page by page, appending each page to text_path and handing its chunks to on_chunks,
+    so only one page of raw text is held at a time. Parse and chunk seconds are added to
+    timings (this may run in a worker process, whose METRICS never reach /metrics).
+    Returns (num_pages, num_chunks).
+    """
+    from .text_chunker import chunk_page_texts
+    timings = {} if timings is None else timings
+    num_pages = num_chunks = 0
+    with open(text_path, "w", encoding="utf-8") as tf:
+        for page in iter_pages(pdf_path, timings):
+            if num_pages:
+                tf.write("\n")
+            tf.write(page["text"])
+            num_pages += 1
+            # chunk large pages
+            t0 = time.perf_counter()
+            chunks = chunk_page_texts([page])
+            timings["chunk"] = timings.get("chunk", 0.0) + time.perf_counter() - t0
+            num_chunks += len(chunks)
+            on_chunks(chunks)
+    return num_pages, num_chunks
@@ -0,0 +1,97 @@
+# app/services/prompt_builder.py
+from typing import List, Dict, Any, Tuple, Optional
+from ..core import config
+from ..core.logger import logger
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(config.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning("tiktoken unavailable, estimating tokens from characters: %s", e)
+            _encoding = False
+    return _encoding
+
+def preload_encoding():
+    """Load the tokenizer up front (the first load may download the BPE file)."""
+    _get_encoding()
+
+def count_tokens(text: str) -> int:
+    enc = _get_encoding()
+    if not enc:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _get_encoding()
+    if not enc:
+        return text[:max_tokens * 4]
+    toks = enc.encode(text, disallowed_special=())
+    return text if len(toks) <= max_tokens else enc.decode(toks[:max_tokens])
+
+def dedupe_overlaps(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Trim text that an earlier (more relevant) chunk of the same page already covers.
+    Overlapping windows from chunk_page_texts otherwise repeat up to `overlap` chars.
+    Returns copies in the original order; fully covered chunks are dropped.
+    """
+    covered: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+    out = []
+    for h in hits:
+        start, end, text = h.get("char_start"), h.get("char_end"), h.get("text") or ""
+        if start is None or end is None:
+            out.append(h)
+            continue
+        spans = covered.setdefault((h["document_id"], h["page_no"]), [])
+        for s, e in spans:
+            if s <= start and end <= e:
+                start = end
+                break
+            if s <= start < e:
+                text = text[e - start:]
+                start = e
+            elif s < end <= e:
+                text = text[:len(text) - (end - s)]
+                end = s
+        if start >= end or not text.strip():
+            continue
+        spans.append((start, end))
+        out.append({**h, "char_start": start, "char_end": end, "text": text})
+    return out
+
+def build_context(hits: List[Dict[str, Any]], budget: Optional[int] = None, header: str = "Doc: {document_id} Page: {page_no}\n",
+                  sep: str = "\n\n---\n\n") -> Tuple[str, List[Dict[str, Any]], int]:
+    """
+    Pack hits (already in relevance order) into a context block of at most `budget` tokens.
+    The last chunk that does not fit whole is truncated; everything after it is dropped.
+    Returns (context, hits used, context tokens).
+    """
+    budget = config.PROMPT_TOKEN_BUDGET if budget is None else budget
+    sep_tokens = count_tokens(sep)
+    parts, used, total = [], [], 0
+    for h in dedupe_overlaps(hits):
+        head = header.format(**h)
+        cost = count_tokens(head) + (sep_tokens if parts else 0)
+        remaining = budget - total - cost
+        if remaining <= 0:
+            break
+        text = h["text"]
+        n = count_tokens(text)
+        if n > remaining:
+            text = truncate_tokens(text, remaining)
+            n = count_tokens(text)
+        parts.append(head + text)
+        used.append({**h, "text": text})
+        total += cost + n
+        if text != h["text"]:
+            break
+    return sep.join(parts), used, total
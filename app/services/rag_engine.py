@@ -2,46 +2,46 @@
 
 import numpy as np
 from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
 
 from ..core.config import EMBED_MODEL
 from ..core.logger import logger
+from ..db import session_scope
 from .llm_client import call_openai_completion, is_enabled
 from .vectorstore import get_vectorstore
+from .retrieval import retrieve_chunks
+from .prompt_builder import build_context, count_tokens
 import json
 
 class RagEngine:
     """
     Full LLM-driven RAG pipeline:
-        embed question → retrieve top-k chunks → build prompt → LLM → structured JSON answer + citations.
+        embed question → retrieve candidates → re-rank to top-k → build prompt → LLM → structured JSON answer + citations.
     """
 
     def __init__(self):
         logger.info("Initializing RAG Engine...")
-        self.model = SentenceTransformer(EMBED_MODEL)
         self.store = get_vectorstore()
+        self.model = self.store.model
         logger.info(f"RAG Engine ready. Model={EMBED_MODEL}")
 
     # ----------------------------------------
     # Embed user query
     # ----------------------------------------
     def embed_query(self, query: str) -> np.ndarray:
-        return self.model.encode([query], show_progress_bar=False)[0]
+        return self.store.embed([query])[0]
 
     # ----------------------------------------
-    # Retrieve top-k chunks
+    # Retrieve candidates and re-rank to top-k
     # ----------------------------------------
     def retrieve(self, query: str, document_ids: Optional[List[str]], top_k: int = 6) -> List[Dict[str, Any]]:
-        q_vec = self.embed_query(query)
-        return self.store.search(q_vec, top_k=top_k, document_ids=document_ids)
+        with session_scope() as db:
+            return retrieve_chunks(db, query, document_ids=document_ids, top_k=top_k)
 
     # ----------------------------------------
     # Build prompt for LLM
     # ----------------------------------------
     def build_prompt(self, question: str, docs: List[Dict]) -> str:
-        context = ""
-        for d in docs:
-            context += f"[Document: {d['document_id']} | Page: {d['page_no']}]\n{d['text']}\n---\n"
+        context, _, _ = build_context(docs, header="[Document: {document_id} | Page: {page_no}]\n", sep="\n---\n")
 
         prompt = f"""
 You are a legal contract analyst. Answer strictly using ONLY the context below.
@@ -91,6 +91,8 @@ Return valid JSON exactly like this:
 
         # Build prompt
         prompt = self.build_prompt(question, retrieved)
+        prompt_tokens = count_tokens(prompt)
+        logger.info("RAG prompt: %d tokens", prompt_tokens)
 
         try:
             llm_output = call_openai_completion(prompt, max_tokens=500, temperature=0.0)
@@ -101,6 +103,7 @@ Return valid JSON exactly like this:
                     {"document_id": r["document_id"], "page_no": r["page_no"], "snippet": r["text"][:250]}
                     for r in retrieved
                 ]
+            result["usage"] = {"prompt_tokens": prompt_tokens}
             return result
         except Exception as e:
             logger.error("LLM output invalid JSON → returning fallback with citations.", exc_info=e)
@@ -109,7 +112,8 @@ Return valid JSON exactly like this:
                 "citations": [
                     {"document_id": r["document_id"], "page_no": r["page_no"], "snippet": r["text"][:250]}
                     for r in retrieved
-                ]
+                ],
+                "usage": {"prompt_tokens": prompt_tokens}
             }
 
 
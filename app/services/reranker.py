@@ -0,0 +1,64 @@
+# app/services/reranker.py
+from threading import Lock
+from typing import List, Dict, Any, Optional
+from ..core import config
+from ..core.logger import logger
+from ..core.metrics import METRICS
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk text) pairs with a small local cross-encoder.
+    Much slower per pair than the bi-encoder, so it only sees the FAISS candidate set.
+    """
+
+    def __init__(self, model_name: str = None, batch_size: int = None):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name or config.RERANK_MODEL
+        self.batch_size = batch_size or config.RERANK_BATCH_SIZE
+        self.model = CrossEncoder(self.model_name, max_length=512)
+        logger.info("Cross-encoder re-ranker ready. Model=%s", self.model_name)
+
+    def rerank(self, question: str, hits: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        hits: list of dicts with "text". Returns the best top_k, each with "rerank_score".
+        """
+        if not hits:
+            return hits
+        pairs = [(question, h.get("text") or "") for h in hits]
+        with METRICS.timer("rerank"):
+            scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        for h, s in zip(hits, scores):
+            h["rerank_score"] = float(s)
+        return sorted(hits, key=lambda h: h["rerank_score"], reverse=True)[:top_k]
+
+    def rerank_many(self, groups: List[tuple], top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        groups: list of (question, hits). Scores every pair in a single predict call so
+        batches fill up across questions. Returns the re-ranked hits per group.
+        """
+        pairs = [(q, h.get("text") or "") for q, hits in groups for h in hits]
+        if not pairs:
+            return [[] for _ in groups]
+        with METRICS.timer("rerank"):
+            scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        out, i = [], 0
+        for _, hits in groups:
+            for h in hits:
+                h["rerank_score"] = float(scores[i])
+                i += 1
+            out.append(sorted(hits, key=lambda h: h["rerank_score"], reverse=True)[:top_k])
+        return out
+
+# singleton
+_reranker = None
+_reranker_lock = Lock()
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    global _reranker
+    if not config.RERANK_MODEL:
+        return None
+    if _reranker is None:
+        # concurrent first requests on the model pool must not load the cross-encoder twice
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
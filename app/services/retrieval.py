@@ -0,0 +1,115 @@
+# app/services/retrieval.py
+from typing import List, Dict, Any, Optional
+from sqlalchemy import tuple_
+from ..core import config
+from ..core.metrics import METRICS
+from ..models.chunks import Chunk
+from .vectorstore import get_vectorstore
+from .reranker import get_reranker
+
+# 3 bind parameters per key; 300 keys keep a query under SQLite's historical 999-variable limit
+FETCH_KEYS_PER_QUERY = 300
+
+def _hit_key(h) -> tuple:
+    return h["document_id"], h["page_no"], h["char_start"]
+
+def fetch_chunk_rows(db, hits_meta: List[Dict[str, Any]]) -> Dict[tuple, Chunk]:
+    """
+    Load the chunk rows behind vector store hits in one query, keyed by (document_id, page_no, char_start).
+    """
+    if not hits_meta:
+        return {}
+    keys = sorted({_hit_key(h) for h in hits_meta})
+    key_cols = tuple_(Chunk.document_id, Chunk.page_no, Chunk.char_start)
+    rows = []
+    with METRICS.timer("db_fetch"):
+        # exact (document_id, page_no, char_start) matches, sliced to stay under SQLite's bind limit
+        for start in range(0, len(keys), FETCH_KEYS_PER_QUERY):
+            rows += db.query(Chunk).filter(key_cols.in_(keys[start:start + FETCH_KEYS_PER_QUERY])).all()
+    return {(c.document_id, c.page_no, c.char_start): c for c in rows}
+
+def fetch_chunks(db, hits_meta: List[Dict[str, Any]], rows: Dict[tuple, Chunk] = None) -> List[Dict[str, Any]]:
+    """
+    Resolve vector store hits to chunk rows in one query, keeping the hit order.
+    """
+    if rows is None:
+        rows = fetch_chunk_rows(db, hits_meta)
+    hits = []
+    for h in hits_meta:
+        chunk = rows.get(_hit_key(h))
+        if chunk:
+            hits.append({
+                "document_id": chunk.document_id,
+                "page_no": chunk.page_no,
+                "char_start": chunk.char_start,
+                "char_end": chunk.char_end,
+                "score": h.get("score"),
+                "text": chunk.text or ""
+            })
+    return hits
+
+def _fetch_chunks_scoped(hits_meta: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # own short session: the connection goes back to the pool before re-ranking / the LLM call
+    from ..db import session_scope
+    with session_scope() as db:
+        return fetch_chunks(db, hits_meta)
+
+def _fetch_rows_scoped(hits_meta: List[Dict[str, Any]]) -> Dict[tuple, Chunk]:
+    # rows stay readable after close: their columns were loaded by the query and nothing is lazy
+    from ..db import session_scope
+    with session_scope() as db:
+        return fetch_chunk_rows(db, hits_meta)
+
+def retrieve_chunks(db, question: str, document_ids: Optional[List[str]] = None, top_k: int = 4) -> List[Dict[str, Any]]:
+    """
+    Retrieval pipeline: wide vector search -> chunk fetch -> cross-encoder re-rank to top_k.
+    Without a re-ranker the vector store order is used as-is.
+    """
+    reranker = get_reranker()
+    n_candidates = max(top_k, config.RETRIEVE_CANDIDATES) if reranker else top_k
+    hits_meta = get_vectorstore().query(question, top_k=n_candidates, filter_docs=document_ids)
+    hits = fetch_chunks(db, hits_meta)
+    if reranker:
+        hits = reranker.rerank(question, hits, top_k)
+    return hits[:top_k]
+
+async def aretrieve_chunks(question: str, document_ids: Optional[List[str]] = None, top_k: int = 4) -> List[Dict[str, Any]]:
+    """
+    retrieve_chunks for async handlers: each stage runs on its executor, never on the event loop.
+    The chunk fetch opens and closes its own session on the DB pool, so callers hold no
+    connection while they stream or wait on the LLM.
+    """
+    from ..core.executors import DB_POOL, MODEL_POOL
+    # first use loads models / the index: do it on the model pool too
+    reranker = await MODEL_POOL.run(get_reranker)
+    vs = await MODEL_POOL.run(get_vectorstore)
+    n_candidates = max(top_k, config.RETRIEVE_CANDIDATES) if reranker else top_k
+    hits_meta = await MODEL_POOL.run(vs.query, question, top_k=n_candidates, filter_docs=document_ids)
+    hits = await DB_POOL.run(_fetch_chunks_scoped, hits_meta)
+    if reranker:
+        hits = await MODEL_POOL.run(reranker.rerank, question, hits, top_k)
+    return hits[:top_k]
+
+async def aretrieve_batch(questions: List[str], document_ids: Optional[List[str]] = None, top_k: int = 4) -> Dict[tuple, List[Dict[str, Any]]]:
+    """
+    Batched retrieval for many questions x many documents: one embed + index search for all
+    questions, one chunk query for all hits and one re-rank pass over all pairs.
+    Returns {(question_index, document_id): hits}; document_id is None without a document filter.
+    """
+    from ..core.executors import DB_POOL, MODEL_POOL
+    reranker = await MODEL_POOL.run(get_reranker)
+    vs = await MODEL_POOL.run(get_vectorstore)
+    n_candidates = max(top_k, config.RETRIEVE_CANDIDATES) if reranker else top_k
+    per_question = await MODEL_POOL.run(vs.query_batch, questions, top_k=n_candidates, filter_docs=document_ids)
+    all_meta = [h for groups in per_question for hits in groups.values() for h in hits]
+    rows = await DB_POOL.run(_fetch_rows_scoped, all_meta)
+    keys, groups = [], []
+    for qi, by_doc in enumerate(per_question):
+        for doc_id, hits_meta in by_doc.items():
+            keys.append((qi, doc_id))
+            groups.append((questions[qi], fetch_chunks(None, hits_meta, rows=rows)))
+    if reranker:
+        ranked = await MODEL_POOL.run(reranker.rerank_many, groups, top_k)
+    else:
+        ranked = [hits[:top_k] for _, hits in groups]
+    return dict(zip(keys, ranked))
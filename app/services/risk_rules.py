@@ -1,61 +1,199 @@
 # app/services/risk_rules.py
+import os
 import re
+import json
+import time
+from threading import Lock
 from typing import List, Dict, Any
+from ..core import config
+from ..core.logger import logger
+from ..core.metrics import METRICS
 
-RULES = [
-    {
-        "id": "auto_renewal_short_notice",
-        "regex": r"(auto-?renew(?:al)?|renew automatically|renewal will occur).*?(\d{1,2})\s*(day|days)",
-        "description": "Auto-renewal clause with specified notice period",
-        "severity": "medium",
-        "post": lambda m: int(m.group(2)) if m else None
-    },
-    {
-        "id": "unlimited_liability",
-        "regex": r"(unlimited liability|no limit on liability|without limitation of liability|no cap on liability)",
-        "description": "Unlimited liability or no-cap language",
-        "severity": "high",
-    },
-    {
-        "id": "broad_indemnity",
-        "regex": r"(indemnif(?:y|ies|ication)|hold harmless).*?(indemnify|hold harmless|defend)",
-        "description": "Potentially broad indemnity",
-        "severity": "medium",
-    },
-    {
-        "id": "missing_confidentiality",
-        "regex": r"(confidentiality|confidential information|non-?disclos)",
-        "description": "Confidentiality clause existence check",
-        "severity": "low",
-    }
-]
-
-def audit_text_for_risks(text: str, document_id: str, page_no: int):
+# rule fields in a pack: id, regex, description, severity, optional flags ("is" by default)
+# and optional value {"group": n, "type": "int"|"float"|"str"} to extract a captured value
+VALUE_TYPES = {"int": int, "float": float, "str": str}
+FLAGS = {"i": re.I, "s": re.S, "m": re.M, "x": re.X}
+PACK_EXTENSIONS = (".json", ".yaml", ".yml")
+
+class CompiledRule:
+    __slots__ = ("id", "pattern", "description", "severity", "value_group", "value_type", "pack")
+
+    def __init__(self, raw: Dict[str, Any], pack: str):
+        self.id = raw["id"]
+        flags = 0
+        for ch in raw.get("flags", "is"):
+            flags |= FLAGS[ch]
+        self.pattern = re.compile(raw["regex"], flags)
+        self.description = raw.get("description", self.id)
+        self.severity = raw.get("severity", "medium")
+        value = raw.get("value") or {}
+        self.value_group = value.get("group")
+        self.value_type = VALUE_TYPES[value.get("type", "str")]
+        self.pack = pack
+
+def _version_key(version: str):
+    return tuple(int(p) if p.isdigit() else 0 for p in re.split(r"[.\-]", str(version)))
+
+def _read_pack(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as fh:
+        if path.endswith(".json"):
+            return json.load(fh)
+        import yaml  # PyYAML; only needed for YAML packs
+        return yaml.safe_load(fh)
+
+def compile_pack(path: str) -> Dict[str, Any]:
+    """
+    Load and compile one pack file. Rules that fail to compile are skipped with a warning
+    rather than failing the whole pack.
+    """
+    data = _read_pack(path) or {}
+    name = data.get("name") or os.path.splitext(os.path.basename(path))[0]
+    rules = []
+    for raw in data.get("rules", []):
+        try:
+            rules.append(CompiledRule(raw, name))
+        except (KeyError, re.error) as e:
+            logger.warning("Skipping risk rule %s in %s: %r", raw.get("id"), path, e)
+    return {"name": name, "version": str(data.get("version", "0")), "path": path, "rules": rules}
+
+class RuleRegistry:
+    """
+    Risk rules compiled from the packs in RISK_RULES_DIR. The directory is re-scanned at most
+    every RISK_RULES_RELOAD_SECONDS; only added or modified files are recompiled, and a file
+    that fails to load keeps its last good version. When several files declare the same pack
+    name, the highest version wins; a rule id defined by more than one pack takes the
+    definition from the pack whose name sorts last.
+    """
+
+    def __init__(self, rules_dir: str = None, reload_seconds: float = None):
+        self.rules_dir = rules_dir or config.RISK_RULES_DIR
+        self.reload_seconds = config.RISK_RULES_RELOAD_SECONDS if reload_seconds is None else reload_seconds
+        self._lock = Lock()
+        self._files: Dict[str, tuple] = {}  # path -> ((mtime_ns, size), compiled pack)
+        self._packs: List[Dict[str, Any]] = []
+        self._rules: List[CompiledRule] = []
+        self._checked = 0.0
+        self._loaded = False
+        self.reload()
+
+    def rules(self) -> List[CompiledRule]:
+        if time.monotonic() - self._checked >= self.reload_seconds:
+            self.reload()
+        return self._rules
+
+    def packs(self) -> List[Dict[str, Any]]:
+        return [{"name": p["name"], "version": p["version"], "path": p["path"],
+                 "rules": [r.id for r in p["rules"]]} for p in self._packs]
+
+    def reload(self):
+        # another thread already reloading: keep serving the current rules
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.monotonic()
+            paths = []
+            if os.path.isdir(self.rules_dir):
+                paths = sorted(os.path.join(self.rules_dir, n) for n in os.listdir(self.rules_dir)
+                               if n.endswith(PACK_EXTENSIONS))
+            files, changed = {}, set(self._files) - set(paths)
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                sig = (st.st_mtime_ns, st.st_size)
+                prev = self._files.get(path)
+                if prev and prev[0] == sig:
+                    files[path] = prev
+                    continue
+                changed.add(path)
+                try:
+                    files[path] = (sig, compile_pack(path))
+                except Exception as e:
+                    logger.exception("Failed to load risk rule pack %s: %s", path, e)
+                    if prev:
+                        files[path] = prev
+            self._files = files
+            if not changed and self._loaded:
+                return
+            latest: Dict[str, Dict[str, Any]] = {}
+            for _, pack in files.values():
+                cur = latest.get(pack["name"])
+                if cur is None or _version_key(pack["version"]) > _version_key(cur["version"]):
+                    latest[pack["name"]] = pack
+            packs = [latest[n] for n in sorted(latest)]
+            by_id: Dict[str, CompiledRule] = {}
+            for pack in packs:
+                for rule in pack["rules"]:
+                    by_id[rule.id] = rule
+            self._packs, self._rules = packs, list(by_id.values())
+            self._loaded = True
+            logger.info("Loaded %d risk rules from %s", len(self._rules),
+                        ", ".join(f"{p['name']}@{p['version']}" for p in packs) or "no packs")
+        finally:
+            self._lock.release()
+
+_registry = None
+_registry_lock = Lock()
+
+METRICS.register_gauge("risk_rules_loaded", lambda: len(_registry._rules) if _registry else 0, "Risk rules currently compiled")
+
+def get_rule_registry() -> RuleRegistry:
+    global _registry
+    if _registry is None:
+        # concurrent first /audit calls must not each compile their own registry
+        with _registry_lock:
+            if _registry is None:
+                _registry = RuleRegistry()
+    return _registry
+
+def flush_rule_stats(stats: Dict[str, list]):
+    """Record per-rule [scans, matches, seconds] accumulated by audit_text_for_risks."""
+    for rule_id, (scans, matches, seconds) in stats.items():
+        METRICS.inc("risk_rule_scans", scans, rule=rule_id)
+        METRICS.inc("risk_rule_scan_seconds", seconds, rule=rule_id)
+        if matches:
+            METRICS.inc("risk_rule_matches", matches, rule=rule_id)
+    stats.clear()
+
+def audit_text_for_risks(text: str, document_id: str, page_no: int, stats: Dict[str, list] = None):
+    """
+    Run every loaded rule over one page of text. Per-rule cost and hit counts (to spot
+    pathological patterns under real load) are accumulated in stats and flushed by the caller
+    with flush_rule_stats; without stats they are flushed once at the end of this call.
+    """
+    flush = stats is None
+    stats = {} if stats is None else stats
     findings = []
     lower = text.lower()
-    for rule in RULES:
-        try:
-            m = re.search(rule["regex"], lower, flags=re.I | re.S)
-        except re.error:
-            m = None
+    for rule in get_rule_registry().rules():
+        t0 = time.perf_counter()
+        m = rule.pattern.search(lower)
+        s = stats.get(rule.id)
+        if s is None:
+            s = stats[rule.id] = [0, 0, 0.0]
+        s[0] += 1
+        s[2] += time.perf_counter() - t0
         if m:
+            s[1] += 1
             ev = {
                 "document_id": document_id,
                 "page_no": page_no,
                 "match_text": m.group(0)[:1000]
             }
             extra = {}
-            if "post" in rule:
+            if rule.value_group is not None:
                 try:
-                    extra_val = rule["post"](m)
-                    extra["value"] = extra_val
+                    extra["value"] = rule.value_type(m.group(rule.value_group))
                 except Exception:
                     extra["value"] = None
             findings.append({
-                "id": rule["id"],
-                "title": rule["description"],
-                "severity": rule["severity"],
+                "id": rule.id,
+                "title": rule.description,
+                "severity": rule.severity,
                 "evidence": ev,
                 "extra": extra
             })
+    if flush:
+        flush_rule_stats(stats)
     return findings
@@ -0,0 +1,336 @@
+# app/services/sharded_store.py
+import os
+import json
+import time
+import zlib
+import atexit
+import itertools
+import multiprocessing as mp
+from threading import Lock
+from typing import List, Dict, Any, Optional
+import numpy as np
+from ..core import config
+from ..core.logger import logger
+from ..core.metrics import METRICS
+from .vectorstore import Embedder, FaissVectorStore
+
+def _serve_shard(conn, index_path: str, dim: int, quantization: str, metric: str):
+    """
+    Shard worker process: owns one FaissVectorStore and answers requests from the coordinator
+    over a Pipe. Vectors arrive already embedded, so the embedding model is never loaded here.
+    """
+    store = FaissVectorStore(index_path=index_path, quantization=quantization, metric=metric, dim=dim)
+    while True:
+        try:
+            req_id, op, args = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            break
+        try:
+            if op == "add":
+                store.add_embeddings(*args)
+                res = store.ntotal
+            elif op == "query":
+                q_emb, top_k, filter_docs = args
+                res = [store.search_vector(q[None, :], top_k=top_k, filter_docs=filter_docs) for q in q_emb]
+            elif op == "query_batch":
+                res = store.search_batch(*args)
+            elif op == "documents":
+                res = list(store._doc_ids)
+            elif op == "stats":
+                res = {"ntotal": store.ntotal, "bytes": store.memory_bytes()}
+            else:
+                raise ValueError(f"unknown op {op}")
+            conn.send((req_id, "ok", res))
+        except Exception as e:
+            conn.send((req_id, "error", repr(e)))
+    conn.close()
+
+class _ShardClient:
+    """
+    Pipe to one shard process. Requests carry an id and replies with any other id (left over
+    from a request that timed out) are dropped. A shard whose process died is restarted from
+    its saved index on the next request.
+    """
+
+    def __init__(self, shard_id: int, index_path: str, dim: int, quantization: str, metric: str):
+        self.shard_id = shard_id
+        self.lock = Lock()  # one outstanding request per pipe
+        self._args = (index_path, dim, quantization, metric)
+        self._ids = itertools.count()
+        self.conn = self.proc = None
+        self._start()
+
+    def _start(self):
+        ctx = mp.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_serve_shard, args=(child, *self._args),
+                                name=f"faiss-shard-{self.shard_id}", daemon=True)
+        self.proc.start()
+        child.close()
+
+    def restart_if_dead(self):
+        if self.proc.is_alive():
+            return
+        logger.warning("Shard %d exited (code %s); restarting", self.shard_id, self.proc.exitcode)
+        METRICS.inc("vector_shard_restarts", 1, shard=str(self.shard_id))
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self._start()
+
+    def send(self, op: str, args=()) -> int:
+        req_id = next(self._ids)
+        self.conn.send((req_id, op, args))
+        return req_id
+
+    def recv(self, req_id: int, timeout: float = None):
+        timeout = config.SHARD_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                raise RuntimeError(f"shard {self.shard_id}: no reply within {timeout}s")
+            got_id, status, res = self.conn.recv()
+            if got_id == req_id:
+                break
+            logger.warning("Shard %d: dropping stale reply %s (waiting for %s)", self.shard_id, got_id, req_id)
+        if status != "ok":
+            raise RuntimeError(f"shard {self.shard_id}: {res}")
+        return res
+
+    def stop(self):
+        try:
+            with self.lock:
+                self.send("stop")
+            self.proc.join(timeout=5)
+        except Exception:
+            pass
+
+class ShardedVectorStore:
+    """
+    Coordinator over VECTOR_SHARDS worker processes, each holding part of the corpus.
+    Embeds in-process, routes adds by document id hash, and scatter-gathers searches
+    across the shards in parallel, merging top-k by score.
+
+    Placement is recorded in routing.json, so raising VECTOR_SHARDS only sends new documents
+    to the new shards; nothing is re-embedded or moved.
+    """
+
+    def __init__(self, n_shards: int = None, root: str = None, model_name: str = None,
+                 quantization: str = None, metric: str = None):
+        self.root = root or config.SHARD_DIR
+        os.makedirs(self.root, exist_ok=True)
+        self.metric = (metric or config.VECTOR_METRIC).lower()
+        self.higher_is_better = self.metric == "ip"
+        self.embedder = Embedder(model_name, self.metric)
+        self.dim = self.embedder.dim
+        self.routing_path = os.path.join(self.root, "routing.json")
+        self.routing: Dict[str, int] = {}
+        if os.path.exists(self.routing_path):
+            with open(self.routing_path, "r", encoding="utf-8") as fh:
+                self.routing = json.load(fh)
+        # never drop a shard that already holds documents
+        n = max(n_shards or config.VECTOR_SHARDS, max(self.routing.values(), default=-1) + 1)
+        self._routing_lock = Lock()
+        for i in range(n):
+            os.makedirs(os.path.join(self.root, f"shard_{i}"), exist_ok=True)
+        self.shards = [
+            _ShardClient(i, os.path.join(self.root, f"shard_{i}", "faiss.index"), self.dim,
+                         quantization or config.VECTOR_QUANTIZATION, self.metric)
+            for i in range(n)
+        ]
+        atexit.register(self.close)
+        self._reconcile_routing()
+        logger.info("Sharded vector store: %d shards under %s", n, self.root)
+
+    def _reconcile_routing(self):
+        # a crash after a shard saved an add but before routing.json was written leaves
+        # documents the table does not know about; recover them from the shards themselves
+        res = self._scatter({i: ("documents", ()) for i in range(len(self.shards))})
+        missing = {d: i for i, docs in res.items() for d in docs if d not in self.routing}
+        if missing:
+            logger.warning("Recovered %d document placements missing from %s", len(missing), self.routing_path)
+            self.routing.update(missing)
+            self._save_routing()
+
+    # ----------------------------------------
+    # Embedding (coordinator side)
+    # ----------------------------------------
+    @property
+    def model(self):
+        return self.embedder.model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embedder.embed(texts)
+
+    def embed_query(self, q: str) -> np.ndarray:
+        return self.embedder.embed_query(q)
+
+    # ----------------------------------------
+    # Routing and scatter-gather
+    # ----------------------------------------
+    def shard_for(self, doc: Dict[str, Any]) -> int:
+        doc_id = doc["document_id"]
+        shard = self.routing.get(doc_id)
+        if shard is None:
+            shard = zlib.crc32(str(doc_id).encode("utf-8")) % len(self.shards)
+        return shard
+
+    def has_document(self, document_id: str) -> bool:
+        return document_id in self.routing
+
+    def _targets(self, filter_docs: Optional[List[str]]) -> List[int]:
+        if not filter_docs:
+            return list(range(len(self.shards)))
+        return sorted({self.routing[d] for d in filter_docs if d in self.routing})
+
+    def _gather(self, requests: Dict[int, tuple]):
+        """
+        requests: {shard_id: (op, args)}. Sends to every shard before reading any reply so the
+        workers run concurrently, then reads every pipe that was sent to, even after a failure.
+        Locks are taken in shard order to avoid deadlocks. Returns ({shard_id: result},
+        {shard_id: error}); dead shards are restarted before the locks are released.
+        """
+        ids = sorted(requests)
+        for i in ids:
+            self.shards[i].lock.acquire()
+        try:
+            sent, out, errors = {}, {}, {}
+            for i in ids:
+                try:
+                    self.shards[i].restart_if_dead()
+                    sent[i] = self.shards[i].send(*requests[i])
+                except Exception as e:
+                    errors[i] = e
+            for i, req_id in sent.items():
+                try:
+                    out[i] = self.shards[i].recv(req_id)
+                except Exception as e:
+                    errors[i] = e
+            for i in errors:
+                logger.error("Shard %d %s failed: %r", i, requests[i][0], errors[i])
+                try:
+                    self.shards[i].restart_if_dead()
+                except Exception as e:
+                    logger.exception("Shard %d restart failed: %s", i, e)
+            return out, errors
+        finally:
+            for i in ids:
+                self.shards[i].lock.release()
+
+    def _scatter(self, requests: Dict[int, tuple]) -> Dict[int, Any]:
+        """
+        _gather() that fails closed: any shard error fails the whole call rather than
+        returning results from the remaining shards.
+        """
+        out, errors = self._gather(requests)
+        if errors:
+            i = min(errors)
+            raise RuntimeError(f"{len(errors)} of {len(requests)} shards failed; shard {i}: {errors[i]}")
+        return out
+
+    def _merge(self, lists: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+        hits = [h for l in lists for h in l]
+        hits.sort(key=lambda h: h["score"], reverse=self.higher_is_better)
+        return hits[:top_k]
+
+    # ----------------------------------------
+    # FaissVectorStore interface
+    # ----------------------------------------
+    def add(self, docs: List[Dict[str, Any]]):
+        texts = [d.get("text", "") for d in docs]
+        if len(texts) == 0:
+            return
+        self.add_embeddings(self.embed(texts), docs)
+
+    def add_embeddings(self, emb: np.ndarray, docs: List[Dict[str, Any]]):
+        emb = np.asarray(emb, dtype="float32")
+        with self._routing_lock:
+            placed: Dict[str, int] = {}
+            by_shard: Dict[int, List[int]] = {}
+            for i, d in enumerate(docs):
+                s = placed.setdefault(d["document_id"], self.shard_for(d))
+                by_shard.setdefault(s, []).append(i)
+        keep = ("document_id", "page_no", "char_start", "char_end")
+        _, errors = self._gather({
+            s: ("add", (emb[rows], [{k: docs[i][k] for k in keep} for i in rows]))
+            for s, rows in by_shard.items()
+        })
+        # record placements only once their shard has saved them, so has_document() never
+        # reports a document whose vectors did not land
+        landed = {d: s for d, s in placed.items() if s not in errors}
+        with self._routing_lock:
+            new = {d: s for d, s in landed.items() if d not in self.routing}
+            if new:
+                self.routing.update(new)
+                self._save_routing()
+        if errors:
+            i = min(errors)
+            raise RuntimeError(f"add failed on {len(errors)} shards; shard {i}: {errors[i]}")
+
+    def _save_routing(self):
+        tmp = self.routing_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.routing, fh)
+        os.replace(tmp, self.routing_path)
+
+    def query(self, q: str, top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        return self.search_vector(self.embed_query(q), top_k=top_k, filter_docs=filter_docs)
+
+    def search_vector(self, q_emb: np.ndarray, top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        targets = self._targets(filter_docs)
+        if not targets:
+            return []
+        with METRICS.timer("vector_search"):
+            res = self._scatter({s: ("query", (q_emb, top_k, filter_docs)) for s in targets})
+        return self._merge([res[s][0] for s in targets], top_k)
+
+    def query_batch(self, questions: List[str], top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        if not questions:
+            return []
+        return self.search_batch(self.embed(list(questions)), top_k=top_k, filter_docs=filter_docs)
+
+    def search_batch(self, q_emb: np.ndarray, top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        targets = self._targets(filter_docs)
+        if not targets:
+            return [{} for _ in range(len(q_emb))]
+        with METRICS.timer("vector_search"):
+            res = self._scatter({s: ("query_batch", (q_emb, top_k, filter_docs)) for s in targets})
+        out = []
+        for qi in range(len(q_emb)):
+            groups: Dict[Any, List[List[Dict[str, Any]]]] = {}
+            for s in targets:
+                for doc_id, hits in res[s][qi].items():
+                    groups.setdefault(doc_id, []).append(hits)
+            out.append({doc_id: self._merge(lists, top_k) for doc_id, lists in groups.items()})
+        return out
+
+    def _stats(self) -> List[Dict[str, int]]:
+        res = self._scatter({i: ("stats", ()) for i in range(len(self.shards))})
+        return [res[i] for i in range(len(self.shards))]
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s["ntotal"] for s in self._stats())
+
+    def memory_bytes(self) -> int:
+        return sum(s["bytes"] for s in self._stats())
+
+    def import_store(self, store: FaissVectorStore, batch: int = 10000):
+        """
+        Distribute an existing single-process index across the shards using its stored
+        full-precision vectors (no re-embedding).
+        """
+        raw = store.raw_vectors()
+        if raw is None or raw.shape[0] != len(store.meta):
+            raise RuntimeError("source store has no complete raw vector file")
+        for start in range(0, len(store.meta), batch):
+            self.add_embeddings(np.array(raw[start:start + batch]), store.meta[start:start + batch])
+        logger.info("Imported %d vectors into %d shards", len(store.meta), len(self.shards))
+
+    def close(self):
+        for s in self.shards:
+            s.stop()
@@ -5,6 +5,7 @@ def chunk_page_texts(pages: List[dict], max_chars: int = 1000, overlap: int = 20
     """
     Given page-based entries, further split very large pages into smaller chunks.
     Returns list of chunks with page_no and char offsets relative to page text start.
+    Not timed here: callers record the "chunk" stage (this often runs in a parse worker process).
     """
     out = []
     for p in pages:
@@ -1,22 +1,142 @@
 # app/services/vectorstore.py
 import os
 import json
+from collections import OrderedDict
+from threading import Lock
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any, Optional
 from ..core import config
 from ..core.logger import logger
+from ..core.metrics import METRICS
+
+QUANTIZATION_MODES = ("none", "fp16", "int8", "pq")
+METRICS_BY_NAME = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+
+def index_kind(index) -> str:
+    """
+    Map a faiss index back to the VECTOR_QUANTIZATION mode it implements.
+    """
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            return "fp16"
+        if index.sq.qtype == faiss.ScalarQuantizer.QT_8bit:
+            return "int8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "none"
+
+class Embedder:
+    """
+    Sentence-transformer wrapper shared by the single and sharded stores. The model is
+    loaded on first use so processes that only hold an index never load it.
+    """
+
+    def __init__(self, model_name: str = None, metric: str = None):
+        self.model_name = model_name or config.EMBED_MODEL
+        self.normalize = (metric or config.VECTOR_METRIC).lower() == "ip"
+        self._model = None
+        self._model_lock = Lock()
+        self._qcache = OrderedDict()
+        self._qcache_lock = Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        with METRICS.timer("embed"):
+            return self.model.encode(
+                texts, convert_to_numpy=True, show_progress_bar=False,
+                normalize_embeddings=self.normalize
+            ).astype("float32")
+
+    def embed_query(self, q: str) -> np.ndarray:
+        """Embed a question, reusing recent embeddings for repeated questions."""
+        if config.QUERY_CACHE_SIZE <= 0:
+            return self.embed([q])
+        with self._qcache_lock:
+            emb = self._qcache.get(q)
+            if emb is not None:
+                self._qcache.move_to_end(q)
+        METRICS.cache("query_embedding", emb is not None)
+        if emb is None:
+            emb = self.embed([q])
+            with self._qcache_lock:
+                self._qcache[q] = emb
+                while len(self._qcache) > config.QUERY_CACHE_SIZE:
+                    self._qcache.popitem(last=False)
+        return emb
 
 class FaissVectorStore:
-    def __init__(self, index_path: str = None, model_name: str = None):
+    def __init__(self, index_path: str = None, model_name: str = None, quantization: str = None, metric: str = None,
+                 dim: int = None):
         self.index_path = index_path or config.FAISS_INDEX_PATH
         self.meta_path = self.index_path + ".meta.json"
-        self.model_name = model_name or config.EMBED_MODEL
-        self.model = SentenceTransformer(self.model_name)
-        self.dim = self.model.get_sentence_embedding_dimension()
+        # full-precision copy of every vector, kept on disk and memory-mapped for exact re-ranking
+        self.vecs_path = self.index_path + ".vecs.f32"
+        self.quantization = (quantization or config.VECTOR_QUANTIZATION).lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            logger.warning("Unknown VECTOR_QUANTIZATION=%s, using float32", self.quantization)
+            self.quantization = "none"
+        self.metric = (metric or config.VECTOR_METRIC).lower()
+        if self.metric not in METRICS_BY_NAME:
+            logger.warning("Unknown VECTOR_METRIC=%s, using l2", self.metric)
+            self.metric = "l2"
+        # inner product over unit vectors is cosine similarity: larger is closer
+        self.higher_is_better = self.metric == "ip"
+        self.embedder = Embedder(model_name, self.metric)
+        # shard workers pass dim so they never load the embedding model
+        self.dim = dim or self.embedder.dim
+        self._raw = None
+        # faiss indexes are not safe to search while another thread adds to them
+        self._index_lock = Lock()
         self._load_or_init()
 
+    # ----------------------------------------
+    # Index construction
+    # ----------------------------------------
+    def _new_index(self, kind: str):
+        metric = METRICS_BY_NAME[self.metric]
+        if kind == "fp16":
+            return faiss.IndexScalarQuantizer(self.dim, faiss.ScalarQuantizer.QT_fp16, metric)
+        if kind == "int8":
+            return faiss.IndexScalarQuantizer(self.dim, faiss.ScalarQuantizer.QT_8bit, metric)
+        if kind == "pq":
+            return faiss.IndexPQ(self.dim, config.PQ_M, config.PQ_NBITS, metric)
+        return faiss.IndexFlat(self.dim, metric)
+
+    def _index_matches(self) -> bool:
+        return index_kind(self.index) == self.quantization and self.index.metric_type == METRICS_BY_NAME[self.metric]
+
+    @property
+    def model(self):
+        return self.embedder.model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embedder.embed(texts)
+
+    def embed_query(self, q: str) -> np.ndarray:
+        return self.embedder.embed_query(q)
+
+    def _train_size(self) -> int:
+        # fp16 needs no training. int8 learns per-dim ranges once and clips anything outside them,
+        # so like PQ's codebooks it waits for a representative sample
+        if self.quantization == "pq":
+            return max(config.QUANT_TRAIN_MIN, 2 ** config.PQ_NBITS)
+        if self.quantization == "int8":
+            return config.QUANT_TRAIN_MIN
+        return 0
+
     def _load_or_init(self):
         if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
             try:
@@ -30,11 +150,91 @@ class FaissVectorStore:
         else:
             self.index = faiss.IndexFlatL2(self.dim)
             self.meta = []
+        # document_id -> vector ids, for searches restricted to a set of documents
+        self._doc_ids: Dict[str, List[int]] = {}
+        for i, m in enumerate(self.meta):
+            self._doc_ids.setdefault(m["document_id"], []).append(i)
+        # rows appended by an add that crashed before save(): drop them so raw row i stays index id i
+        size = os.path.getsize(self.vecs_path) if os.path.exists(self.vecs_path) else 0
+        if size > len(self.meta) * 4 * self.dim:
+            logger.warning("Truncating %s from %d to %d vectors", self.vecs_path, size / (4 * self.dim), len(self.meta))
+            with open(self.vecs_path, "r+b") as fh:
+                fh.truncate(len(self.meta) * 4 * self.dim)
+            self._raw = None
+        # indexes written before the raw vector file existed: seed it from the flat index
+        if self.raw_count() != self.index.ntotal and index_kind(self.index) == "none":
+            self._write_raw(self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else None, append=False)
+        if not self._index_matches():
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        """
+        Re-encode the stored vectors into the configured index type and metric. Until a quantized
+        index can be trained the store keeps serving from a flat index.
+        """
+        raw = self.raw_vectors()
+        n = 0 if raw is None else raw.shape[0]
+        if n != len(self.meta):
+            logger.warning("Raw vectors (%d) do not match metadata (%d); cannot switch to %s", n, len(self.meta), self.quantization)
+            return
+        kind = self.quantization
+        if n < self._train_size():
+            kind = "none"
+        if kind == index_kind(self.index) and self.index.metric_type == METRICS_BY_NAME[self.metric]:
+            return
+        index = self._new_index(kind)
+        if n and not index.is_trained:
+            index.train(self._prepare(raw))
+        for start in range(0, n, 10000):
+            index.add(self._prepare(raw[start:start + 10000]))
+        self.index = index
+        logger.info("Rebuilt FAISS index as %s/%s with %d vectors", kind, self.metric, n)
+        self.save()
+
+    def _prepare(self, vecs: np.ndarray) -> np.ndarray:
+        # vectors stored before switching to "ip" were not normalized
+        vecs = np.array(vecs, dtype="float32")
+        if self.metric == "ip":
+            faiss.normalize_L2(vecs)
+        return vecs
+
+    # ----------------------------------------
+    # Full-precision vector file
+    # ----------------------------------------
+    def _write_raw(self, emb: Optional[np.ndarray], append: bool = True):
+        with open(self.vecs_path, "ab" if append else "wb") as fh:
+            if emb is not None:
+                fh.write(np.ascontiguousarray(emb, dtype="float32").tobytes())
+        self._raw = None
+
+    def raw_count(self) -> int:
+        if not os.path.exists(self.vecs_path):
+            return 0
+        return os.path.getsize(self.vecs_path) // (4 * self.dim)
+
+    def raw_vectors(self) -> Optional[np.ndarray]:
+        if self._raw is None:
+            n = self.raw_count()
+            if n == 0:
+                return None
+            self._raw = np.memmap(self.vecs_path, dtype="float32", mode="r", shape=(n, self.dim))
+        return self._raw
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the index codes (excludes the memory-mapped raw vectors)."""
+        if isinstance(self.index, faiss.IndexFlat):
+            return self.index.ntotal * self.dim * 4
+        if hasattr(self.index, "code_size"):
+            return self.index.ntotal * self.index.code_size
+        return 0
 
     def save(self):
         faiss.write_index(self.index, self.index_path)
         json.dump(self.meta, open(self.meta_path, "w", encoding="utf-8"))
 
+    def has_document(self, document_id: str) -> bool:
+        return document_id in self._doc_ids
+
     def add(self, docs: List[Dict[str, Any]]):
         """
         docs: list of {document_id, page_no, char_start, char_end, text}
@@ -42,37 +242,172 @@ class FaissVectorStore:
         texts = [d.get("text", "") for d in docs]
         if len(texts) == 0:
             return
-        emb = self.model.encode(texts, convert_to_numpy=True).astype("float32")
-        self.index.add(emb)
+        self.add_embeddings(self.embed(texts), docs)
+
+    def add_embeddings(self, emb: np.ndarray, docs: List[Dict[str, Any]]):
+        """
+        Index vectors that were already embedded (one row per doc, same order).
+        """
+        with self._index_lock:
+            self._add_locked(np.asarray(emb, dtype="float32"), docs)
+
+    def _add_locked(self, emb: np.ndarray, docs: List[Dict[str, Any]]):
+        self._write_raw(emb)
         for d in docs:
+            self._doc_ids.setdefault(d["document_id"], []).append(len(self.meta))
             self.meta.append({
                 "document_id": d["document_id"],
                 "page_no": d["page_no"],
                 "char_start": d["char_start"],
                 "char_end": d["char_end"]
             })
+        if not self._index_matches() and self.raw_count() >= self._train_size():
+            # enough vectors to train the configured quantizer; this also indexes the new batch
+            self._rebuild_index()
+            if self._index_matches():
+                return
+        # raw rows are stored as given; the index gets them normalized for "ip" (imported or
+        # legacy L2 vectors are not unit length)
+        emb = self._prepare(emb)
+        if not self.index.is_trained:
+            self.index.train(emb)
+        self.index.add(emb)
         self.save()
 
+    def _exact_rerank(self, q_emb: np.ndarray, ids: np.ndarray, dists: np.ndarray):
+        """
+        Re-score approximate candidates against the full-precision vectors.
+        Returns (ids, scores) sorted best first under the store metric.
+        """
+        raw = self.raw_vectors()
+        if raw is None or raw.shape[0] < self.index.ntotal:
+            return ids, dists
+        ids = np.sort(ids[ids >= 0])  # sorted reads are sequential on the memmap
+        if len(ids) == 0:
+            return ids, dists[:0]
+        cand = self._prepare(raw[ids])
+        if self.higher_is_better:
+            exact = cand @ q_emb[0]
+            order = np.argsort(-exact)
+        else:
+            exact = ((cand - q_emb[0]) ** 2).sum(axis=1)
+            order = np.argsort(exact)
+        return ids[order], exact[order]
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
     def query(self, q: str, top_k: int = 4, filter_docs: Optional[List[str]] = None):
-        q_emb = self.model.encode([q], convert_to_numpy=True).astype("float32")
-        D, I = self.index.search(q_emb, top_k*3)  # fetch more and filter
+        return self.search_vector(self.embed_query(q), top_k=top_k, filter_docs=filter_docs)
+
+    def search_vector(self, q_emb: np.ndarray, top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        """
+        query() for an already embedded question (shape (1, dim)).
+        """
+        with METRICS.timer("vector_search"), self._index_lock:
+            fetch = top_k * 3  # fetch more and filter
+            quantized = index_kind(self.index) != "none"
+            if quantized:
+                fetch *= config.EXACT_RERANK_FACTOR
+            D, I = self.index.search(q_emb, fetch)
+            ids, dists = I[0], D[0]
+            if quantized:
+                ids, dists = self._exact_rerank(q_emb, ids, dists)
         hits = []
-        for idx in I[0]:
+        for idx, dist in zip(ids, dists):
             if idx < 0 or idx >= len(self.meta):
                 continue
             meta = self.meta[idx]
             if filter_docs and meta["document_id"] not in filter_docs:
                 continue
             # create minimal hit; caller should fetch chunk text from DB
-            hits.append({"meta_idx": idx, **meta})
+            hits.append({"meta_idx": int(idx), "score": float(dist), **meta})
             if len(hits) >= top_k:
                 break
         return hits
 
+    def _search_subset(self, q_emb: np.ndarray, ids: np.ndarray):
+        """
+        Score every vector in ids for every query in one call. Quantized indexes are scored
+        exactly from the raw vectors; a float32 index uses an ID selector, falling back to the
+        raw vectors on FAISS builds that reject search params.
+        """
+        raw = self.raw_vectors()
+        exact = raw is not None and raw.shape[0] >= self.index.ntotal
+        if index_kind(self.index) == "none" or not exact:
+            try:
+                params = faiss.SearchParameters()
+                params.sel = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+                return self.index.search(q_emb, len(ids), params=params)
+            except (RuntimeError, AttributeError, TypeError):
+                if not exact:
+                    raise
+        cand = self._prepare(raw[ids])
+        if self.higher_is_better:
+            scores = q_emb @ cand.T
+            order = np.argsort(-scores, axis=1)
+        else:
+            scores = (q_emb ** 2).sum(axis=1)[:, None] - 2 * q_emb @ cand.T + (cand ** 2).sum(axis=1)[None, :]
+            order = np.argsort(scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), ids[order]
+
+    def query_batch(self, questions: List[str], top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        """
+        Search many questions with one embed call and one index search.
+        Returns, per question, {document_id: hits} with up to top_k hits for each document in
+        filter_docs, or {None: hits} with the corpus-wide top_k when no filter is given.
+        """
+        if not questions:
+            return []
+        return self.search_batch(self.embed(list(questions)), top_k=top_k, filter_docs=filter_docs)
+
+    def search_batch(self, q_emb: np.ndarray, top_k: int = 4, filter_docs: Optional[List[str]] = None):
+        """
+        query_batch() for already embedded questions (shape (n, dim)).
+        """
+        with METRICS.timer("vector_search"), self._index_lock:
+            if filter_docs:
+                ids = np.array(sorted(i for d in set(filter_docs) for i in self._doc_ids.get(d, ())), dtype="int64")
+                if len(ids) == 0:
+                    return [{} for _ in range(len(q_emb))]
+                D, I = self._search_subset(q_emb, ids)
+            elif index_kind(self.index) != "none":
+                # quantized: over-fetch, then re-score each question's candidates exactly
+                D, I = self.index.search(q_emb, top_k * config.EXACT_RERANK_FACTOR)
+                ranked = [self._exact_rerank(q_emb[qi:qi + 1], I[qi], D[qi]) for qi in range(len(q_emb))]
+                I, D = [r[0] for r in ranked], [r[1] for r in ranked]
+            else:
+                D, I = self.index.search(q_emb, top_k)
+        out = []
+        for drow, irow in zip(D, I):
+            groups = {}
+            for idx, dist in zip(irow, drow):
+                if idx < 0 or idx >= len(self.meta):
+                    continue
+                meta = self.meta[idx]
+                g = groups.setdefault(meta["document_id"] if filter_docs else None, [])
+                if len(g) < top_k:
+                    g.append({"meta_idx": int(idx), "score": float(dist), **meta})
+            out.append(groups)
+        return out
+
 # singleton
 _store = None
+_store_lock = Lock()
+
+METRICS.register_gauge("vector_index_vectors", lambda: _store.ntotal if _store else 0, "Vectors in the FAISS index")
+METRICS.register_gauge("vector_index_bytes", lambda: _store.memory_bytes() if _store else 0, "Approximate in-memory size of the FAISS index codes")
+
 def get_vectorstore():
     global _store
     if _store is None:
-        _store = FaissVectorStore()
+        # one store per process: a second one would spawn its own shards or reload the index
+        with _store_lock:
+            if _store is None:
+                if config.VECTOR_SHARDS > 1:
+                    from .sharded_store import ShardedVectorStore
+                    _store = ShardedVectorStore()
+                else:
+                    _store = FaissVectorStore()
     return _store
@@ -0,0 +1,300 @@
+# eval/benchmark.py
+"""
+Self-contained offline benchmark.
+
+Generates a synthetic contract corpus into a scratch data dir, then measures:
+  - ingest throughput per stage (pdf parse, chunk, db write, embed, index add), through /api/ingest
+  - /api/ask latency (p50/p95/p99) and QPS under concurrency, in-process via the ASGI app
+  - retrieval recall@k against the labelled fact pages of the synthetic corpus
+  - /api/audit and /api/extract throughput
+
+Results are written as JSON so runs can be diffed between versions:
+
+    python -m eval.benchmark --docs 50 --pages 8 --concurrency 8 --requests 200 --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+STATES = ["Delaware", "New York", "California", "Texas", "England and Wales", "India", "Ontario", "Singapore"]
+FILLER = [
+    "The parties shall cooperate in good faith to perform their obligations under this Agreement.",
+    "Each party represents that it has full power and authority to enter into this Agreement.",
+    "Notices shall be delivered in writing to the addresses set out on the signature page.",
+    "No failure or delay in exercising any right shall operate as a waiver of that right.",
+    "This Agreement constitutes the entire agreement between the parties on its subject matter.",
+    "Any amendment to this Agreement must be made in writing and signed by both parties.",
+    "Neither party may assign this Agreement without the prior written consent of the other party.",
+    "If any provision is held invalid, the remaining provisions shall continue in full force.",
+]
+
+def percentile(values, p):
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+def latency_summary(values):
+    return {
+        "n": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 2) if values else None,
+        "p50_ms": round(1000 * percentile(values, 50), 2) if values else None,
+        "p95_ms": round(1000 * percentile(values, 95), 2) if values else None,
+        "p99_ms": round(1000 * percentile(values, 99), 2) if values else None,
+    }
+
+def make_corpus(out_dir: str, n_docs: int, n_pages: int, seed: int):
+    """
+    Write n_docs synthetic contracts as PDFs. Each one states a few facts on known pages;
+    those become the labelled questions used for recall@k.
+    """
+    import fitz
+    rng = random.Random(seed)
+    docs = []
+    for d in range(n_docs):
+        facts = {
+            "governing_law": rng.choice(STATES),
+            "term_years": rng.randint(1, 9),
+            "notice_days": rng.choice([10, 15, 20, 30, 45, 60, 90]),
+            "cap": rng.randint(1, 50) * 10000,
+        }
+        fact_pages = rng.sample(range(1, n_pages + 1), k=min(4, n_pages))
+        sentences = {
+            "governing_law": f"This Agreement shall be governed by and construed in accordance with the laws of {facts['governing_law']}.",
+            "term_years": f"The initial term of this Agreement is {facts['term_years']} years from the Effective Date.",
+            "notice_days": f"This Agreement will auto-renew for successive one year periods unless either party gives {facts['notice_days']} days written notice.",
+            "cap": f"The total liability of either party shall not exceed USD {facts['cap']:,} in the aggregate.",
+        }
+        questions = {
+            "governing_law": ("What is the governing law of this agreement?", facts["governing_law"]),
+            "term_years": ("How long is the initial term of the agreement?", f"{facts['term_years']} years"),
+            "notice_days": ("What notice period applies to auto-renewal?", f"{facts['notice_days']} days"),
+            "cap": ("What is the cap on liability?", f"{facts['cap']:,}"),
+        }
+        pdf = fitz.open()
+        page_of = {}
+        for p in range(1, n_pages + 1):
+            lines = [f"MASTER SERVICES AGREEMENT {d:04d} - Page {p}", ""]
+            lines += rng.sample(FILLER, k=5)
+            for key, fp in zip(sentences, fact_pages):
+                if fp == p:
+                    lines.insert(2 + rng.randint(0, 4), sentences[key])
+                    page_of[key] = p
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n".join(lines), fontsize=10)
+        path = os.path.join(out_dir, f"synthetic_{d:04d}.pdf")
+        pdf.save(path)
+        pdf.close()
+        docs.append({
+            "path": path,
+            "labels": [{"key": k, "question": q, "expected": a, "page_no": page_of[k]} for k, (q, a) in questions.items() if k in page_of],
+        })
+    return docs
+
+INGEST_STAGES = ("pdf_parse", "chunk", "db_write", "embed_document", "index_add")
+
+def _stage_seconds():
+    from app.core.metrics import METRICS
+    snap = METRICS.get_snapshot().get("stage_duration_seconds", {})
+    out = {}
+    for stage in INGEST_STAGES:
+        s = snap.get(f"stage={stage}")
+        out[stage] = s["count"] * s["mean_ms"] / 1000 if s and s["mean_ms"] is not None else 0.0
+    return out
+
+async def bench_ingest(docs, files_per_request: int):
+    """
+    POST the corpus to /api/ingest through the ASGI app, so the production path is measured:
+    streaming multipart receive, parse_and_store on the parse pool with page-batched commits,
+    then embedding and indexing. Per-stage busy time is the change in the stage_duration_seconds
+    the endpoint records from the timings parse_and_store returns; with PARSE_WORKERS > 1 stages
+    overlap, so their sum can exceed the wall time.
+    """
+    import httpx
+    from sqlalchemy import func
+    from app.main import app
+    from app.db import session_scope
+    from app.models.document import Document
+    from app.models.chunks import Chunk
+
+    before = _stage_seconds()
+    errors = 0
+    t_all = time.perf_counter()
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=600) as client:
+        for start in range(0, len(docs), files_per_request):
+            batch = docs[start:start + files_per_request]
+            files = [("files", (os.path.basename(d["path"]), open(d["path"], "rb").read(), "application/pdf")) for d in batch]
+            # indexing runs as a background task, which the in-process transport awaits
+            r = await client.post("/api/ingest", files=files)
+            if r.status_code != 200:
+                errors += 1
+                continue
+            for d, f in zip(batch, r.json()["files"]):
+                d["document_id"] = f["document_id"]
+    total = time.perf_counter() - t_all
+    after = _stage_seconds()
+    stages = {k: after[k] - before[k] for k in INGEST_STAGES}
+
+    ids = [d["document_id"] for d in docs if "document_id" in d]
+    with session_scope() as db:
+        n_pages = db.query(func.sum(Document.num_pages)).filter(Document.id.in_(ids)).scalar() or 0
+        n_chunks = db.query(func.count(Chunk.id)).filter(Chunk.document_id.in_(ids)).scalar() or 0
+    return {
+        "documents": len(ids),
+        "requests": -(-len(docs) // files_per_request),
+        "errors": errors,
+        "pages": n_pages,
+        "chunks": n_chunks,
+        "total_s": round(total, 3),
+        "docs_per_s": round(len(ids) / total, 2),
+        "stages": {
+            k: {"total_s": round(v, 3), "pages_per_s": round(n_pages / v, 1) if v else None,
+                "chunks_per_s": round(n_chunks / v, 1) if v else None}
+            for k, v in stages.items()
+        },
+    }
+
+def bench_recall(docs, k: int):
+    """
+    recall@k: fraction of labelled questions whose fact page is among the top-k hits,
+    for the raw vector search and for the full retrieval pipeline (with re-ranking if enabled).
+    """
+    from app.db import SessionLocal
+    from app.services.vectorstore import get_vectorstore
+    from app.services.retrieval import retrieve_chunks
+
+    vs = get_vectorstore()
+    db = SessionLocal()
+    vector_hits = pipeline_hits = total = 0
+    for d in docs:
+        for lab in d["labels"]:
+            total += 1
+            hits = vs.query(lab["question"], top_k=k, filter_docs=[d["document_id"]])
+            vector_hits += any(h["page_no"] == lab["page_no"] for h in hits)
+            hits = retrieve_chunks(db, lab["question"], document_ids=[d["document_id"]], top_k=k)
+            pipeline_hits += any(h["page_no"] == lab["page_no"] for h in hits)
+    db.close()
+    return {
+        "k": k,
+        "questions": total,
+        "vector_recall_at_k": round(vector_hits / total, 4) if total else None,
+        "pipeline_recall_at_k": round(pipeline_hits / total, 4) if total else None,
+    }
+
+async def bench_http(docs, concurrency: int, n_requests: int, k: int, seed: int):
+    import httpx
+    from app.main import app
+
+    rng = random.Random(seed)
+    labelled = [(d, lab) for d in docs for lab in d["labels"]]
+    sem = asyncio.Semaphore(concurrency)
+    lat, errors, answer_hits = [], 0, 0
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=300) as client:
+        async def one(d, lab):
+            nonlocal errors, answer_hits
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/api/ask", json={"question": lab["question"], "document_ids": [d["document_id"]], "top_k": k})
+                lat.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    errors += 1
+                elif lab["expected"].lower() in r.json().get("answer", "").lower():
+                    answer_hits += 1
+
+        # warm up models outside the measured window
+        await client.post("/api/ask", json={"question": "warm up", "top_k": k})
+        t0 = time.perf_counter()
+        await asyncio.gather(*[one(*rng.choice(labelled)) for _ in range(n_requests)])
+        wall = time.perf_counter() - t0
+
+        ask = {"concurrency": concurrency, "requests": n_requests, "errors": errors, "qps": round(n_requests / wall, 2),
+               "answer_contains_expected": round(answer_hits / n_requests, 4), **latency_summary(lat)}
+
+        results = {}
+        for route, body in (("audit", lambda d: {"document_ids": [d["document_id"]]}), ("extract", lambda d: {"document_id": d["document_id"]})):
+            lat = []
+            errs = 0
+            t0 = time.perf_counter()
+            for d in docs:
+                t1 = time.perf_counter()
+                r = await client.post(f"/api/{route}", json=body(d))
+                lat.append(time.perf_counter() - t1)
+                errs += r.status_code != 200
+            wall = time.perf_counter() - t0
+            results[route] = {"documents": len(docs), "errors": errs, "docs_per_s": round(len(docs) / wall, 2), **latency_summary(lat)}
+    return ask, results
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=6)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--files-per-request", type=int, default=8, help="PDFs per /api/ingest call")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--workdir", default=None, help="scratch data dir (default: a temp dir)")
+    ap.add_argument("--llm", action="store_true", help="keep OPENAI_API_KEY so /api/ask calls the LLM")
+    ap.add_argument("--out", default=None, help="write JSON results here (default: stdout only)")
+    a = ap.parse_args()
+
+    workdir = a.workdir or tempfile.mkdtemp(prefix="ci-bench-")
+    # the app reads its storage locations at import time, so point them at the scratch dir first
+    os.environ["DATA_DIR"] = workdir
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "meta.db")
+    if not a.llm:
+        os.environ["OPENAI_API_KEY"] = ""
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    from app.main import app
+    from app.core import config
+
+    t0 = time.perf_counter()
+    docs = make_corpus(corpus_dir, a.docs, a.pages, a.seed)
+    gen_s = time.perf_counter() - t0
+    ingest = asyncio.run(bench_ingest(docs, a.files_per_request))
+    docs = [d for d in docs if "document_id" in d]
+    recall = bench_recall(docs, a.k)
+    ask, other = asyncio.run(bench_http(docs, a.concurrency, a.requests, a.k, a.seed))
+
+    results = {
+        "version": app.version,
+        "git": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "params": vars(a),
+        "config": {
+            "embed_model": config.EMBED_MODEL,
+            "vector_metric": config.VECTOR_METRIC,
+            "vector_quantization": config.VECTOR_QUANTIZATION,
+            "rerank_model": config.RERANK_MODEL,
+            "prompt_token_budget": config.PROMPT_TOKEN_BUDGET,
+        },
+        "corpus": {"documents": a.docs, "pages_per_doc": a.pages, "generate_s": round(gen_s, 3), "workdir": workdir},
+        "ingest": ingest,
+        "retrieval": recall,
+        "ask": ask,
+        **other,
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if a.out:
+        with open(a.out, "w") as fh:
+            fh.write(text)
+
+if __name__ == "__main__":
+    main()
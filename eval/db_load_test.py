@@ -0,0 +1,79 @@
+# eval/db_load_test.py
+"""
+DB connection load test: hammers /api/ask, /api/audit and /api/extract in-process and
+samples the connection pool while it runs. Connections checked out should stay within
+DB_POOL_SIZE + DB_MAX_OVERFLOW and drop back to 0 once requests finish (no leaks).
+
+    python -m eval.db_load_test --concurrency 32 --seconds 30 --out eval/db_load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+async def run(concurrency: int, seconds: float, sample_ms: int):
+    import httpx
+    from app.main import app
+    from app.db import engine, session_scope
+    from app.core import config
+    from app.models.document import Document
+
+    with session_scope() as db:
+        doc_ids = [d.id for d in db.query(Document.id).all()]
+    if not doc_ids:
+        raise SystemExit("no documents ingested; run eval/benchmark.py or ingest some PDFs first")
+    questions = [q["question"] for q in json.load(open("eval/qa_eval_set.json"))]
+    samples, status = [], {}
+    stop = time.perf_counter() + seconds
+
+    async def sampler():
+        while time.perf_counter() < stop:
+            samples.append(engine.pool.checkedout())
+            await asyncio.sleep(sample_ms / 1000)
+
+    async with httpx.AsyncClient(app=app, base_url="http://load", timeout=120) as client:
+        async def worker(i):
+            rng = random.Random(i)
+            while time.perf_counter() < stop:
+                kind = rng.choice(("ask", "ask", "audit", "extract"))
+                doc = rng.choice(doc_ids)
+                if kind == "ask":
+                    r = await client.post("/api/ask", json={"question": rng.choice(questions), "document_ids": [doc]})
+                elif kind == "audit":
+                    r = await client.post("/api/audit", json={"document_ids": [doc]})
+                else:
+                    r = await client.post("/api/extract", json={"document_id": doc})
+                key = f"{kind}:{r.status_code}"
+                status[key] = status.get(key, 0) + 1
+
+        await asyncio.gather(sampler(), *[worker(i) for i in range(concurrency)])
+    await asyncio.sleep(0.5)
+    after = engine.pool.checkedout()
+    return {
+        "database": engine.url.get_backend_name(),
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "requests": status,
+        "checked_out_max": max(samples) if samples else 0,
+        "checked_out_mean": round(sum(samples) / len(samples), 2) if samples else 0,
+        "checked_out_after": after,
+        "stable": after == 0 and (max(samples) if samples else 0) <= config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW,
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seconds", type=float, default=30)
+    ap.add_argument("--sample-ms", type=int, default=100)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+    # measure the DB path, not OpenAI latency
+    os.environ["OPENAI_API_KEY"] = ""
+    report = asyncio.run(run(a.concurrency, a.seconds, a.sample_ms))
+    print(json.dumps(report, indent=2))
+    if a.out:
+        json.dump(report, open(a.out, "w"), indent=2)
@@ -0,0 +1,95 @@
+# eval/quant_eval.py
+"""
+Recall@k vs memory for the vector quantization modes.
+
+Uses the questions from eval/qa_eval_set.json against the vectors already stored in
+data/faiss.index (read from the raw vector file; the live index is not touched). The float32
+flat index under VECTOR_METRIC is the ground truth; every other mode is scored with and
+without the exact re-ranking pass.
+
+    python -m eval.quant_eval --k 4 --out eval/quant_report.json
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from app.core import config
+from app.services.vectorstore import METRICS_BY_NAME
+
+DATA = json.load(open("eval/qa_eval_set.json"))
+
+METRIC = METRICS_BY_NAME.get(config.VECTOR_METRIC, faiss.METRIC_L2)
+
+def build(kind: str, vecs: np.ndarray, dim: int, pq_m: int):
+    if kind == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, METRIC)
+    elif kind == "int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, METRIC)
+    elif kind == "pq":
+        # small corpora cannot train 256 centroids per sub-quantizer
+        nbits = min(config.PQ_NBITS, int(np.log2(max(len(vecs), 2))))
+        index = faiss.IndexPQ(dim, pq_m, nbits, METRIC)
+    else:
+        index = faiss.IndexFlat(dim, METRIC)
+    if not index.is_trained:
+        index.train(vecs)
+    index.add(vecs)
+    return index
+
+def recall(truth: np.ndarray, got: np.ndarray, k: int) -> float:
+    hits = [len(set(t[:k]) & set(g[:k])) / k for t, g in zip(truth, got)]
+    return float(np.mean(hits))
+
+def exact_order(vecs: np.ndarray, q: np.ndarray) -> np.ndarray:
+    if METRIC == faiss.METRIC_INNER_PRODUCT:
+        return np.argsort(-(vecs @ q))
+    return np.argsort(((vecs - q) ** 2).sum(axis=1))
+
+def run(k: int, factor: int, pq_m: int, out: str = None):
+    model = SentenceTransformer(config.EMBED_MODEL)
+    dim = model.get_sentence_embedding_dimension()
+    # read the full-precision vectors directly; building a store here could rebuild and save the live index
+    vecs = np.fromfile(config.FAISS_INDEX_PATH + ".vecs.f32", dtype="float32").reshape(-1, dim)
+    q = model.encode([d["question"] for d in DATA], convert_to_numpy=True).astype("float32")
+    if METRIC == faiss.METRIC_INNER_PRODUCT:
+        # same preparation as the store: cosine over unit vectors
+        faiss.normalize_L2(vecs)
+        faiss.normalize_L2(q)
+    _, truth = build("none", vecs, dim, pq_m).search(q, k)
+    report = {"vectors": int(vecs.shape[0]), "dim": dim, "metric": config.VECTOR_METRIC, "k": k,
+              "rerank_factor": factor, "modes": []}
+    for kind in ("none", "fp16", "int8", "pq"):
+        index = build(kind, vecs, dim, pq_m)
+        t0 = time.perf_counter()
+        _, approx = index.search(q, k)
+        t_approx = (time.perf_counter() - t0) / len(q)
+        _, cand = index.search(q, k * factor)
+        reranked = []
+        for qi, ids in enumerate(cand):
+            ids = np.sort(ids[ids >= 0])
+            reranked.append(ids[exact_order(vecs[ids], q[qi])])
+        code_bytes = len(faiss.serialize_index(index))
+        report["modes"].append({
+            "mode": kind,
+            "index_bytes": code_bytes,
+            "bytes_per_vector": round(code_bytes / max(index.ntotal, 1), 1),
+            "recall_at_k": round(recall(truth, approx, k), 4),
+            "recall_at_k_reranked": round(recall(truth, reranked, k), 4),
+            "search_ms": round(t_approx * 1000, 3),
+        })
+    for m in report["modes"]:
+        print(f"{m['mode']:>5}  {m['bytes_per_vector']:>8} B/vec  recall@{k}={m['recall_at_k']:.3f}  reranked={m['recall_at_k_reranked']:.3f}  {m['search_ms']}ms")
+    if out:
+        json.dump(report, open(out, "w"), indent=2)
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--factor", type=int, default=config.EXACT_RERANK_FACTOR)
+    ap.add_argument("--pq-m", type=int, default=config.PQ_M)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+    run(a.k, a.factor, a.pq_m, a.out)
@@ -0,0 +1,88 @@
+# eval/rerank_eval.py
+"""
+Offline retrieval benchmark: L2 vs cosine (normalized inner product) vs cosine + cross-encoder.
+
+For each question in eval/qa_eval_set.json it records whether the labelled document and
+the expected answer text appear in the top-k chunks, plus per-stage latency.
+
+    python -m eval.rerank_eval --k 4 --candidates 20 --out eval/rerank_report.json
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from app.core import config
+from app.db import SessionLocal
+from app.services.vectorstore import get_vectorstore
+from app.services.retrieval import fetch_chunks
+from app.services.reranker import CrossEncoderReranker
+
+DATA = json.load(open("eval/qa_eval_set.json"))
+
+def score(hits, item):
+    text = " ".join(h["text"].lower() for h in hits)
+    return {
+        "doc_hit": any(h["document_id"] == item["document_id"] for h in hits),
+        "answer_in_context": item["expected"].lower() in text,
+        "context_chars": len(text),
+    }
+
+def search(index, q_emb, n, meta, doc_id):
+    _, I = index.search(q_emb, n * 3)
+    hits = [{"meta_idx": int(i), **meta[i]} for i in I[0] if 0 <= i < len(meta) and meta[i]["document_id"] == doc_id]
+    return hits[:n]
+
+def run(k: int, candidates: int, out: str = None):
+    store = get_vectorstore()
+    db = SessionLocal()
+    vecs = np.array(store.raw_vectors(), dtype="float32")
+    l2 = faiss.IndexFlatL2(store.dim)
+    l2.add(vecs)
+    unit = vecs.copy()
+    faiss.normalize_L2(unit)
+    ip = faiss.IndexFlatIP(store.dim)
+    ip.add(unit)
+    reranker = CrossEncoderReranker(batch_size=config.RERANK_BATCH_SIZE)
+    rows = {"l2": [], "ip": [], "ip+rerank": []}
+    for item in DATA:
+        q = store.model.encode([item["question"]], convert_to_numpy=True, show_progress_bar=False).astype("float32")
+        qn = q.copy()
+        faiss.normalize_L2(qn)
+        t0 = time.perf_counter()
+        hits = fetch_chunks(db, search(l2, q, k, store.meta, item["document_id"]))
+        rows["l2"].append({**score(hits, item), "ms": (time.perf_counter() - t0) * 1000})
+        t0 = time.perf_counter()
+        hits = fetch_chunks(db, search(ip, qn, k, store.meta, item["document_id"]))
+        rows["ip"].append({**score(hits, item), "ms": (time.perf_counter() - t0) * 1000})
+        t0 = time.perf_counter()
+        cands = fetch_chunks(db, search(ip, qn, candidates, store.meta, item["document_id"]))
+        t1 = time.perf_counter()
+        hits = reranker.rerank(item["question"], cands, k)
+        t2 = time.perf_counter()
+        rows["ip+rerank"].append({**score(hits, item), "ms": (t2 - t0) * 1000, "rerank_ms": (t2 - t1) * 1000})
+    report = {"questions": len(DATA), "k": k, "candidates": candidates, "rerank_model": reranker.model_name, "pipelines": {}}
+    for name, r in rows.items():
+        ms = np.array([x["ms"] for x in r])
+        report["pipelines"][name] = {
+            "doc_hit_rate": round(float(np.mean([x["doc_hit"] for x in r])), 4),
+            "answer_in_context_rate": round(float(np.mean([x["answer_in_context"] for x in r])), 4),
+            "avg_context_chars": round(float(np.mean([x["context_chars"] for x in r])), 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        }
+        if name == "ip+rerank":
+            report["pipelines"][name]["rerank_p50_ms"] = round(float(np.percentile([x["rerank_ms"] for x in r], 50)), 2)
+        p = report["pipelines"][name]
+        print(f"{name:>10}  answer-in-context={p['answer_in_context_rate']:.3f}  p50={p['p50_ms']}ms  p95={p['p95_ms']}ms")
+    if out:
+        json.dump(report, open(out, "w"), indent=2)
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--candidates", type=int, default=config.RETRIEVE_CANDIDATES)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+    run(a.k, a.candidates, a.out)
@@ -0,0 +1,46 @@
+"""initial schema (documents, chunks)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases created by init_db() already have these tables
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if "documents" not in existing:
+        op.create_table(
+            "documents",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("uploaded_at", sa.DateTime()),
+            sa.Column("num_pages", sa.Integer()),
+            sa.Column("path_pdf", sa.String(), nullable=False),
+            sa.Column("path_text", sa.String(), nullable=False),
+        )
+        op.create_index("ix_documents_id", "documents", ["id"])
+    if "chunks" not in existing:
+        op.create_table(
+            "chunks",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("document_id", sa.String()),
+            sa.Column("page_no", sa.Integer()),
+            sa.Column("char_start", sa.Integer()),
+            sa.Column("char_end", sa.Integer()),
+            sa.Column("text", sa.Text()),
+        )
+        op.create_index("ix_chunks_id", "chunks", ["id"])
+        op.create_index("ix_chunks_document_id", "chunks", ["document_id"])
+
+
+def downgrade():
+    op.drop_table("chunks")
+    op.drop_table("documents")
@@ -0,0 +1,23 @@
+"""composite indexes for chunk lookups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS: fresh databases already got them from Base.metadata.create_all
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_document_page ON chunks (document_id, page_no)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_document_char_start ON chunks (document_id, char_start)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_chunks_document_char_start")
+    op.execute("DROP INDEX IF EXISTS ix_chunks_document_page")